@@ -60,6 +60,10 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'mainapp.routers.PinPrimaryAfterWriteMiddleware',
+    'mainapp.middleware.ProfilerMiddleware',
+    'mainapp.nplusone.NPlusOneMiddleware',
+    'mainapp.middleware.ServerTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'KMS.urls'
@@ -87,13 +91,111 @@ WSGI_APPLICATION = 'KMS.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# Pragmas run on every new SQLite connection. WAL lets the dashboards read while
+# stage entries are being written, and with synchronous=NORMAL a commit no
+# longer waits for an fsync (only the last transactions can be lost, on power
+# failure, never corrupted). cache_size is in KiB when negative.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'cache_size': -int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536')),
+    'temp_store': 'MEMORY',
+}
+
+SQLITE_TUNED_OPTIONS = {
+    'init_command': '; '.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+    # Seconds a connection waits for another writer before "database is locked"
+    'timeout': float(os.getenv('SQLITE_BUSY_TIMEOUT', '20')),
+    # Take the write lock when a transaction starts; a deferred transaction that
+    # has to upgrade its lock fails at once instead of waiting out the timeout
+    'transaction_mode': 'IMMEDIATE',
+}
+
+# The replica snapshot is only read: it keeps the journal mode it was written
+# with (not WAL, which would leave -wal/-shm files behind when refresh_replica
+# swaps the file) and refuses writes
+SQLITE_REPLICA_OPTIONS = {
+    'init_command': '; '.join(
+        [f'PRAGMA {name}={SQLITE_PRAGMAS[name]}' for name in ('mmap_size', 'cache_size', 'temp_store')]
+        + ['PRAGMA query_only=1']
+    ),
+    'timeout': SQLITE_TUNED_OPTIONS['timeout'],
 }
 
+# Hand the entry forms' writes to one writer thread per process, which commits
+# the writes arriving within WRITE_GROUP_WINDOW_MS of each other together
+SERIALIZE_WRITES = os.getenv('SERIALIZE_WRITES', '0') == '1'
+WRITE_GROUP_WINDOW_MS = int(os.getenv('WRITE_GROUP_WINDOW_MS', '5'))
+
+# SQLITE_TUNING=0 falls back to SQLite's own defaults
+SQLITE_TUNING = os.getenv('SQLITE_TUNING', '1') == '1'
+
+# DATABASE_ENGINE=postgresql switches to PostgreSQL, configured by the
+# POSTGRES_* variables
+DATABASE_ENGINE = os.getenv('DATABASE_ENGINE', 'sqlite')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'kms'),
+            'USER': os.getenv('POSTGRES_USER', 'kms'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            # Test a reused connection before handing it to a request
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if os.getenv('POSTGRES_POOL', '1') == '1':
+        from psycopg_pool import ConnectionPool
+
+        # Connections are kept open in a per-process psycopg pool and checked
+        # before use. Django doesn't allow CONN_MAX_AGE together with a pool.
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.getenv('POSTGRES_POOL_MIN_SIZE', '2')),
+                'max_size': int(os.getenv('POSTGRES_POOL_MAX_SIZE', '10')),
+                'timeout': float(os.getenv('POSTGRES_POOL_TIMEOUT', '10')),
+                'check': ConnectionPool.check_connection,
+            },
+        }
+    else:
+        # Persistent connections, reused by the requests of one worker
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('POSTGRES_CONN_MAX_AGE', '600'))
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': SQLITE_TUNED_OPTIONS if SQLITE_TUNING else {},
+        }
+    }
+
+# Read replica used by the read-only reporting views: a PostgreSQL standby, or
+# for local testing a SQLite snapshot of the database file that the
+# refresh_replica command keeps up to date
+if DATABASE_ENGINE == 'postgresql' and os.getenv('POSTGRES_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('POSTGRES_REPLICA_HOST'),
+        'PORT': os.getenv('POSTGRES_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+elif DATABASE_ENGINE != 'postgresql' and os.getenv('SQLITE_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('SQLITE_REPLICA_PATH'),
+        'OPTIONS': SQLITE_REPLICA_OPTIONS,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['mainapp.routers.ReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they saved something
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '10'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -137,6 +239,9 @@ STATICFILES_DIRS = [
 
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# Files the app writes: command exports and request profiles
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', str(BASE_DIR / 'media'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -157,6 +262,81 @@ MESSAGE_TAGS = {
 
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Seconds the index view's dashboard counters are cached for. Status changes drop
+# the snapshot early, but only in the cache of the process that made them unless
+# a shared cache backend is configured.
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', '60'))
+
+# Seconds a rendered order detail page section is cached for. Saving the order
+# or any of its stage records replaces the cached sections right away.
+ORDER_DETAIL_CACHE_TIMEOUT = int(os.getenv('ORDER_DETAIL_CACHE_TIMEOUT', '3600'))
+
+# Delta exports start this many seconds before the previous export did. A row's
+# updated_at is stamped when it is saved, not when its transaction commits, so
+# a write committed during an export can carry an earlier time; the overlap has
+# to be longer than any such transaction. Rows changed within it are exported again.
+EXPORT_WATERMARK_OVERLAP = int(os.getenv('EXPORT_WATERMARK_OVERLAP', '300'))
+
+# Number of orders shown per page in the order listings
+ORDER_PAGE_SIZE = int(os.getenv('ORDER_PAGE_SIZE', '50'))
+
+# Seconds before a process reloads its autocomplete indexes from the database.
+# Values saved in the same process show up immediately.
+AUTOCOMPLETE_MAX_AGE = int(os.getenv('AUTOCOMPLETE_MAX_AGE', '300'))
+
+# Send each response's SQL, view and render times in a Server-Timing header
+SERVER_TIMING = os.getenv('SERVER_TIMING', '1') == '1'
+
+# Requests taking longer than this many milliseconds are logged to the
+# mainapp.performance logger with their timings
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', '500'))
+
+# Who may read the Prometheus metrics at /metrics: these client addresses, or
+# anyone sending METRICS_TOKEN as a bearer token. Run several worker processes
+# with PROMETHEUS_MULTIPROC_DIR set to an empty directory shared by them, so a
+# scrape sums up the metrics of all of them.
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Staff users can profile a request by adding ?profile=1 to it, this many times
+# an hour each; the stacks are sampled every PROFILE_INTERVAL_MS milliseconds
+PROFILE_REQUESTS_PER_HOUR = int(os.getenv('PROFILE_REQUESTS_PER_HOUR', '10'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+
+# Queries taking this many milliseconds or longer are logged to the
+# mainapp.slow_queries logger with their plan; with SLOW_QUERY_LOG set they go
+# to that file too, one JSON line each, for the slow_query_report command
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', '')
+
+# Warn about requests running the same query more than NPLUSONE_THRESHOLD
+# times, on by default with DEBUG and always under the test runner
+# (manage.py test --nplusone-raise makes them errors)
+NPLUSONE_DETECT = os.getenv('NPLUSONE_DETECT', '1' if DEBUG else '0') == '1'
+NPLUSONE_THRESHOLD = int(os.getenv('NPLUSONE_THRESHOLD', '5'))
+NPLUSONE_RAISE = os.getenv('NPLUSONE_RAISE', '0') == '1'
+TEST_RUNNER = 'mainapp.test_runner.NPlusOneTestRunner'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_query_file': {
+            'class': 'logging.FileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'formatter': 'message',
+        },
+    } if SLOW_QUERY_LOG else {},
+    'loggers': {
+        'mainapp.slow_queries': {
+            'handlers': ['slow_query_file'] if SLOW_QUERY_LOG else [],
+        },
+    },
+}
+
 BRAND_FULL_NAME = os.getenv('BRAND_NAME_FULL', 'Default Full Name')
 BRAND_SHORT_NAME = os.getenv('BRAND_NAME_SHORT', 'Default Short Name')
 
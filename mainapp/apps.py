@@ -4,3 +4,43 @@ from django.apps import AppConfig
 class MainappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mainapp'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_save, post_delete
+
+        from .autocomplete import AUTOCOMPLETE_SOURCES, add_on_save
+        from .metrics import init_status_transitions
+        from .models import remove_from_rollups
+        from .order_stages import STAGE_MODELS, bump_on_change
+        from .routers import note_write
+        from .search import SEARCH_FIELDS, index_on_save, unindex_on_delete
+        from .slow_queries import watch_connection
+
+        # Keep the full-text search index in step with orders and stage records
+        for model_name in SEARCH_FIELDS:
+            model = self.get_model(model_name)
+            post_save.connect(index_on_save, sender=model, dispatch_uid=f'search_index_{model_name}')
+            post_delete.connect(unindex_on_delete, sender=model, dispatch_uid=f'search_unindex_{model_name}')
+
+        # Add newly typed names to the autocomplete indexes of this process
+        for model_name in {model_name for sources in AUTOCOMPLETE_SOURCES.values() for model_name, _ in sources}:
+            post_save.connect(add_on_save, sender=self.get_model(model_name), dispatch_uid=f'autocomplete_{model_name}')
+
+        # Drop the cached order detail sections whenever the order or one of its
+        # stage records changes
+        for model in [self.get_model('Order')] + [model for _, model in STAGE_MODELS]:
+            post_save.connect(bump_on_change, sender=model, dispatch_uid=f'order_detail_{model.__name__}')
+            post_delete.connect(bump_on_change, sender=model, dispatch_uid=f'order_detail_delete_{model.__name__}')
+
+        # Keep the rollup tables right however orders are deleted
+        post_delete.connect(remove_from_rollups, sender=self.get_model('Order'), dispatch_uid='order_rollups_delete')
+
+        # Pin users who just saved something to the primary database
+        post_save.connect(note_write, dispatch_uid='replica_note_save')
+        post_delete.connect(note_write, dispatch_uid='replica_note_delete')
+
+        init_status_transitions([status for status, _ in self.get_model('Order').STATUS])
+
+        # Log slow queries with their plans
+        connection_created.connect(watch_connection, dispatch_uid='slow_query_log')
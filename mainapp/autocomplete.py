@@ -0,0 +1,126 @@
+# Prefix autocomplete for the party and fabric names typed into the entry forms.
+# Every process keeps a sorted list of the distinct values of each field and
+# answers lookups with a binary search, so typing never queries the database.
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.apps import apps
+from django.conf import settings
+
+# Columns whose distinct values make up each autocomplete field, as
+# (model name, field name) pairs
+AUTOCOMPLETE_SOURCES = {
+    'order_received_from': [('Order', 'order_received_from'), ('Dispatch', 'dispatched_to')],
+    'purchased_from': [('FabricPurchased', 'purchased_from')],
+    'dyer_printer_name': [('PrintingAndDyeingSent', 'dyer_printer_name'), ('FabricPurchased', 'fabric_dyer')],
+    'job_worker_name': [
+        ('ClothCutting', 'job_worker_name'),
+        ('Stitching', 'job_worker_name'),
+        ('ExtraWork', 'job_worker_name'),
+        ('FinishingAndPacking', 'job_worker_name'),
+    ],
+    'fabric_detail': [
+        ('FabricPurchased', 'fabric_detail'),
+        ('PrintingAndDyeingSent', 'fabric_detail'),
+        ('ClothCutting', 'fabric_detail'),
+    ],
+}
+
+AUTOCOMPLETE_LIMIT = 10
+
+
+def _key(value):
+    return ' '.join(value.split()).casefold()
+
+
+class PrefixIndex:
+    """
+    Distinct values of one autocomplete field, kept sorted by their case folded
+    form so every value starting with a prefix is a contiguous slice. Adding a
+    value replaces the list with a new one rather than changing it in place, so
+    lookups, which don't lock, always search a whole sorted list.
+    """
+    def __init__(self, values=()):
+        self._entries = sorted({(_key(value), value) for value in values if value and value.strip()})
+        self._lock = threading.Lock()
+
+    def add(self, value):
+        if not value or not value.strip():
+            return
+        entry = (_key(value), value)
+        with self._lock:
+            entries = self._entries
+            position = bisect_left(entries, entry)
+            if position == len(entries) or entries[position] != entry:
+                entries = entries.copy()
+                insort(entries, entry)
+                self._entries = entries
+
+    def lookup(self, prefix, limit=AUTOCOMPLETE_LIMIT):
+        prefix = _key(prefix)
+        entries = self._entries
+        results = []
+        position = bisect_left(entries, (prefix,))
+        while position < len(entries) and len(results) < limit:
+            key, value = entries[position]
+            if not key.startswith(prefix):
+                break
+            results.append(value)
+            position += 1
+        return results
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_indexes = {}
+_loaded_at = {}
+_load_lock = threading.Lock()
+
+
+def _load(field):
+    values = []
+    for model_name, field_name in AUTOCOMPLETE_SOURCES[field]:
+        model = apps.get_model('mainapp', model_name)
+        values.extend(model.objects.order_by().values_list(field_name, flat=True).distinct())
+    return PrefixIndex(values)
+
+
+def _is_stale(field):
+    return field not in _indexes or time.monotonic() - _loaded_at[field] > settings.AUTOCOMPLETE_MAX_AGE
+
+
+def get_index(field):
+    """
+    Return the prefix index of ``field``, loading it on first use. Indexes are
+    reloaded after AUTOCOMPLETE_MAX_AGE seconds to pick up values saved by other
+    processes and to drop values that are no longer used.
+    """
+    if _is_stale(field):
+        with _load_lock:
+            # Another thread may have loaded it while this one waited for the lock
+            if _is_stale(field):
+                index = _load(field)
+                # _loaded_at first, as unlocked readers look it up once the index is there
+                _loaded_at[field] = time.monotonic()
+                _indexes[field] = index
+    return _indexes[field]
+
+
+def suggest(field, prefix, limit=AUTOCOMPLETE_LIMIT):
+    if not prefix.strip():
+        return []
+    return get_index(field).lookup(prefix, limit)
+
+
+def add_on_save(sender, instance, raw=False, **kwargs):
+    # Only indexes that are already loaded are updated; the others will read the
+    # new value from the database when they are first used
+    for field, sources in AUTOCOMPLETE_SOURCES.items():
+        index = _indexes.get(field)
+        if index is None:
+            continue
+        for model_name, field_name in sources:
+            if model_name == sender.__name__:
+                index.add(getattr(instance, field_name))
@@ -0,0 +1,111 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum, Window
+from django.db.models.functions import RowNumber
+
+from .metrics import record_cache_lookup
+from .models import Order, DailyOrderRollup, DASHBOARD_CACHE_KEY
+
+STATUSES = [status for status, _ in Order.STATUS]
+
+# Number of most recent orders listed under each status on the dashboard
+STATUS_GROUP_LIMIT = 5
+
+
+def build_dashboard_snapshot():
+    """
+    Compute the index view's counters. All counters, including the per status
+    counts for this month, come from a single conditional aggregation; the
+    pending duration chart needs one more query.
+    """
+    today = date.today()
+    first_day_of_month = today.replace(day=1)
+
+    aggregates = {
+        'total_orders': Count('id'),
+        'in_pending': Count('id', filter=Q(status='Pending')),
+        'dispatched_orders': Count('id', filter=Q(status='Dispatched')),
+    }
+    for index, status in enumerate(STATUSES):
+        aggregates[f'month_{index}'] = Count('id', filter=Q(status=status, order_date__gte=first_day_of_month))
+    counts = Order.objects.aggregate(**aggregates)
+
+    # Most recent orders that are not dispatched yet, for the pending duration chart
+    incomplete_orders = (
+        Order.objects
+        .exclude(status='Dispatched')
+        .order_by('-order_date')
+        .values('style_id', 'order_date')[:10]
+    )
+    order_labels = []
+    waiting_times = []
+    for order in incomplete_orders:
+        order_labels.append(f"Order #{order['style_id']}")
+        waiting_times.append((today - order['order_date']).days)
+
+    return {
+        'total_orders': counts['total_orders'],
+        'in_pending': counts['in_pending'],
+        'in_production': counts['total_orders'] - counts['dispatched_orders'] - counts['in_pending'],
+        'dispatched_orders': counts['dispatched_orders'],
+        'statuses': STATUSES,
+        'order_counts': [counts[f'month_{index}'] for index in range(len(STATUSES))],
+        'order_labels': order_labels,
+        'waiting_time_in_days': waiting_times,
+    }
+
+
+def get_dashboard_snapshot():
+    """
+    Return the cached dashboard snapshot, rebuilding it when it has expired or was
+    dropped by an order status change.
+    """
+    snapshot = cache.get(DASHBOARD_CACHE_KEY)
+    record_cache_lookup('dashboard', snapshot is not None)
+    if snapshot is None:
+        snapshot = build_dashboard_snapshot()
+        cache.set(DASHBOARD_CACHE_KEY, snapshot, settings.DASHBOARD_CACHE_TIMEOUT)
+    return snapshot
+
+
+def get_status_groups(limit=STATUS_GROUP_LIMIT):
+    """
+    Order counts and the ``limit`` most recent orders for every status, in status
+    order. Counts come from the daily rollup table and the per status lists from
+    one windowed query, so templates never have to filter orders themselves.
+    """
+    counts = dict(
+        DailyOrderRollup.objects
+        .values_list('status')
+        .annotate(order_count=Sum('order_count'))
+        .order_by()
+    )
+    total = sum(counts.values())
+
+    groups = {
+        status: {
+            'status': status,
+            'count': counts.get(status, 0),
+            'percent': round(counts.get(status, 0) * 100 / total) if total else 0,
+            'orders': [],
+        }
+        for status in STATUSES
+    }
+
+    recent_orders = (
+        Order.objects
+        .annotate(position=Window(
+            RowNumber(),
+            partition_by=F('status'),
+            order_by=[F('order_date').desc(), F('id').desc()],
+        ))
+        .filter(position__lte=limit)
+        .order_by('status', 'position')
+    )
+    for order in recent_orders:
+        if order.status in groups:
+            groups[order.status]['orders'].append(order)
+
+    return list(groups.values())
@@ -0,0 +1,283 @@
+import csv
+from datetime import timedelta
+from django.conf import settings
+
+from django.db.models import Count, Max, Prefetch, Q
+
+from .models import ExportWatermark, FabricPurchased, PrintingAndDyeingSent, PrintingAndDyeingReceived, ClothCutting, Stitching, ExtraWork, FinishingAndPacking, Dispatch
+
+# Number of orders fetched (together with their stage records) per round trip
+EXPORT_CHUNK_SIZE = 2000
+
+# Stage models exported as a single record per order, keyed by their reverse accessor
+STAGE_PREFETCHES = [
+    ('fabricpurchased_set', FabricPurchased),
+    ('printinganddyeingsent_set', PrintingAndDyeingSent),
+    ('printinganddyeingreceived_set', PrintingAndDyeingReceived),
+    ('clothcutting_set', ClothCutting),
+    ('stitching_set', Stitching),
+    ('finishingandpacking_set', FinishingAndPacking),
+    ('dispatch_set', Dispatch),
+]
+
+BASE_HEADER = [
+    'Order ID', 'Style ID', 'PO Number', 'Order Date', 'Order From',
+    # Size quantities
+    'Qty XS', 'Qty S', 'Qty M', 'Qty L', 'Qty XL', 'Qty 2XL', 'Qty 3XL',
+    'Qty 4XL', 'Qty 5XL', 'Qty 6XL', 'Qty 7XL', 'Qty 8XL', 'Qty 9XL', 'Qty 10XL',
+    'Total Quantity', 'Rate', 'Status', 'Amount',
+
+    # Fabric Purchased fields
+    'Fabric Purchase Date', 'Purchased From', 'Fabric Quantity', 'Fabric Rate', 'Fabric Amount',
+    'Invoice Number', 'Fabric Detail', 'Fabric Length', 'Fabric Dyer',
+
+    # Printing & Dyeing Sent fields
+    'P&D Sent Date', 'Dyer/Printer Name', 'P&D Fabric Detail', 'P&D Fabric Length',
+    'P&D Issued Quantity', 'P&D Received Status',
+
+    # Printing & Dyeing Received fields
+    'P&D Received Date', 'Shrinkage (%)', 'P&D Received Quantity',
+    'P&D Balance Quantity', 'P&D Received Challan', 'P&D Rate', 'P&D Amount',
+
+    # Cloth Cutting fields
+    'Cutting Issued Date', 'Cutting Challan', 'Cutting Worker Name', 'Cutting Fabric Detail',
+    'Cutting Fabric Length', 'Cutting Issued Quantity', 'Cutting Received Quantity',
+    'Cutting Balance', 'Cutting Received Date', 'Cutting Received Challan', 'Cutting Rate', 'Cutting Amount',
+
+    # Stitching fields
+    'Stitching Issued Date', 'Stitching Challan', 'Stitching Worker Name', 'Stitching Issued Quantity',
+    'Stitching Received Quantity', 'Stitching Balance', 'Stitching Received Date',
+    'Stitching Rate', 'Stitching Amount',
+
+    # Finishing & Packing fields
+    'F&P Issued Date', 'F&P Challan', 'F&P Worker Name', 'F&P Issued Quantity',
+    'F&P Packed Quantity', 'F&P Rejected', 'F&P Rate', 'F&P Amount',
+
+    # Dispatch fields
+    'Dispatch Date', 'Dispatched To', 'Dispatch Quantity', 'Delivery Note',
+    'Dispatch Invoice Number', 'Box Details',
+]
+
+# Number of CSV columns written for each ExtraWork entry
+EXTRA_WORK_FIELD_COUNT = 10
+
+
+class Echo:
+    """
+    File-like object that hands back whatever is written to it, so csv.writer
+    can be used to produce lines for a StreamingHttpResponse.
+    """
+    def write(self, value):
+        return value
+
+
+def get_max_extra_works(orders):
+    """Largest number of ExtraWork entries on any of the given orders, in one query."""
+    result = (
+        ExtraWork.objects
+        .filter(order__in=orders.order_by().values('id'))
+        .values('order')
+        .annotate(extra_work_count=Count('id'))
+        .order_by()
+        .aggregate(max_extra_works=Max('extra_work_count'))
+    )
+    return result['max_extra_works'] or 0
+
+
+def touched_since(orders, since):
+    """
+    Restrict the orders queryset to orders that were changed, or had any stage
+    record changed, after ``since``.
+    """
+    touched = Q(updated_at__gt=since)
+    for model in [model for _, model in STAGE_PREFETCHES] + [ExtraWork]:
+        touched |= Q(id__in=model.objects.filter(updated_at__gt=since).values('order_id'))
+    return orders.filter(touched)
+
+
+def get_watermark(consumer):
+    """Time of the last export made for ``consumer``, or None if it never exported."""
+    watermark = ExportWatermark.objects.filter(consumer=consumer).first()
+    return watermark.exported_at if watermark else None
+
+
+def set_watermark(consumer, exported_at):
+    """
+    Record an export for ``consumer`` that started at ``exported_at``. The next
+    delta starts EXPORT_WATERMARK_OVERLAP seconds earlier, so it repeats the rows
+    changed just before, rather than missing writes committed after the export read.
+    """
+    exported_at -= timedelta(seconds=settings.EXPORT_WATERMARK_OVERLAP)
+    ExportWatermark.objects.update_or_create(consumer=consumer, defaults={'exported_at': exported_at})
+
+
+def get_header(max_extra_works):
+    # ExtraWork headers go at the end
+    extra_work_headers = []
+    for i in range(1, max_extra_works + 1):
+        extra_work_headers.extend([
+            f'Extra Work {i} Issued Date',
+            f'Extra Work {i} Challan',
+            f'Extra Work {i} Worker Name',
+            f'Extra Work {i} Type',
+            f'Extra Work {i} Issued Qty',
+            f'Extra Work {i} Received Qty',
+            f'Extra Work {i} Balance',
+            f'Extra Work {i} Rate',
+            f'Extra Work {i} Amount',
+            f'Extra Work {i} Received Date'
+        ])
+    return BASE_HEADER + extra_work_headers
+
+
+def with_stage_records(orders):
+    """
+    Prefetch every stage model on the orders queryset. Records are ordered by id
+    so the first one matches what ``.filter(order=order).first()`` used to return.
+    """
+    prefetches = [
+        Prefetch(accessor, queryset=model.objects.order_by('id'))
+        for accessor, model in STAGE_PREFETCHES
+    ]
+    prefetches.append(Prefetch('extrawork_set', queryset=ExtraWork.objects.order_by('id')))
+    return orders.prefetch_related(*prefetches)
+
+
+def _first(order, accessor):
+    records = getattr(order, accessor).all()
+    return records[0] if records else None
+
+
+def get_order_row(order, max_extra_works):
+    """Build a CSV row for an order fetched through ``with_stage_records``."""
+    fabric = _first(order, 'fabricpurchased_set')
+    pd_sent = _first(order, 'printinganddyeingsent_set')
+    pd_received = _first(order, 'printinganddyeingreceived_set')
+    cutting = _first(order, 'clothcutting_set')
+    stitching = _first(order, 'stitching_set')
+    finishing = _first(order, 'finishingandpacking_set')
+    dispatch = _first(order, 'dispatch_set')
+
+    # Base row (without ExtraWork)
+    base_row = [
+        order.id, order.style_id, order.po_number, order.order_date, order.order_received_from,
+        # Size quantities
+        order.quantity_xs, order.quantity_s, order.quantity_m, order.quantity_l,
+        order.quantity_xl, order.quantity_2xl, order.quantity_3xl, order.quantity_4xl,
+        order.quantity_5xl, order.quantity_6xl, order.quantity_7xl, order.quantity_8xl,
+        order.quantity_9xl, order.quantity_10xl,
+        order.quantity, order.rate, order.status, order.amount,
+
+        # Fabric Purchased fields
+        fabric.fabric_purchase_date if fabric else '',
+        fabric.purchased_from if fabric else '',
+        fabric.quantity if fabric else '',
+        fabric.rate if fabric else '',
+        fabric.amount if fabric else '',
+        fabric.invoice_number if fabric else '',
+        fabric.fabric_detail if fabric else '',
+        fabric.fabric_length if fabric else '',
+        fabric.fabric_dyer if fabric else '',
+
+        # Printing & Dyeing Sent fields
+        pd_sent.issued_challan_date if pd_sent else '',
+        pd_sent.dyer_printer_name if pd_sent else '',
+        pd_sent.fabric_detail if pd_sent else '',
+        pd_sent.fabric_length if pd_sent else '',
+        pd_sent.issued_challan_quantity if pd_sent else '',
+        pd_sent.received if pd_sent else '',
+
+        # Printing & Dyeing Received fields
+        pd_received.received_date if pd_received else '',
+        pd_received.shrinkage_in_percentage if pd_received else '',
+        pd_received.received_quantity if pd_received else '',
+        pd_received.balance_quantity if pd_received else '',
+        pd_received.received_challan_number if pd_received else '',
+        pd_received.rate if pd_received else '',
+        pd_received.amount if pd_received else '',
+
+        # Cloth Cutting fields
+        cutting.issued_challan_date if cutting else '',
+        cutting.issued_challan_number if cutting else '',
+        cutting.job_worker_name if cutting else '',
+        cutting.fabric_detail if cutting else '',
+        cutting.fabric_length if cutting else '',
+        cutting.issued_challan_quantity if cutting else '',
+        cutting.received_quantity if cutting else '',
+        cutting.balance_quantity if cutting else '',
+        cutting.received_date if cutting else '',
+        cutting.received_challan_number if cutting else '',
+        cutting.rate if cutting else '',
+        cutting.amount if cutting else '',
+
+        # Stitching fields
+        stitching.issued_challan_date if stitching else '',
+        stitching.issued_challan_number if stitching else '',
+        stitching.job_worker_name if stitching else '',
+        stitching.issued_challan_quantity if stitching else '',
+        stitching.received_quantity if stitching else '',
+        stitching.balance_quantity if stitching else '',
+        stitching.received_date if stitching else '',
+        stitching.rate if stitching else '',
+        stitching.amount if stitching else '',
+
+        # Finishing & Packing fields
+        finishing.issued_challan_date if finishing else '',
+        finishing.issued_challan_number if finishing else '',
+        finishing.job_worker_name if finishing else '',
+        finishing.issued_challan_quantity if finishing else '',
+        finishing.packed_quantity if finishing else '',
+        finishing.rejected if finishing else '',
+        finishing.rate if finishing else '',
+        finishing.amount if finishing else '',
+
+        # Dispatch fields
+        dispatch.dispatch_date if dispatch else '',
+        dispatch.dispatched_to if dispatch else '',
+        dispatch.quantity if dispatch else '',
+        dispatch.delivery_note if dispatch else '',
+        dispatch.invoice_number if dispatch else '',
+        dispatch.box_details if dispatch else '',
+    ]
+
+    # Add ExtraWork data, padding orders with fewer entries
+    extra_works = order.extrawork_set.all()
+    extra_work_data = []
+    for i in range(max_extra_works):
+        if i < len(extra_works):
+            work = extra_works[i]
+            extra_work_data.extend([
+                work.issued_challan_date,
+                work.issued_challan_number,
+                work.job_worker_name,
+                work.extra_work_name,
+                work.issued_challan_quantity,
+                work.received_quantity,
+                work.balance_quantity,
+                work.rate,
+                work.amount,
+                work.received_date
+            ])
+        else:
+            extra_work_data.extend([''] * EXTRA_WORK_FIELD_COUNT)
+
+    return base_row + extra_work_data
+
+
+def iter_order_rows(orders, max_extra_works, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield CSV rows for the orders queryset. Orders are read in chunks of
+    ``chunk_size`` and each chunk prefetches its stage records, so the number of
+    queries per chunk is fixed and only one chunk is held in memory at a time.
+    """
+    for order in with_stage_records(orders).iterator(chunk_size=chunk_size):
+        yield get_order_row(order, max_extra_works)
+
+
+def stream_orders_csv(orders, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the encoded CSV lines (header first) for the orders queryset."""
+    writer = csv.writer(Echo())
+    max_extra_works = get_max_extra_works(orders)
+    yield writer.writerow(get_header(max_extra_works))
+    for row in iter_order_rows(orders, max_extra_works, chunk_size):
+        yield writer.writerow(row)
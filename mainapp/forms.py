@@ -1,8 +1,19 @@
 from django import forms
+from django.urls import reverse_lazy
 from django.utils.safestring import mark_safe
 from .models import Order, FabricPurchased, PrintingAndDyeingSent, PrintingAndDyeingReceived, ClothCutting, Stitching, ExtraWork, FinishingAndPacking, Dispatch
 from crispy_forms.helper import FormHelper
 
+class AutocompleteInput(forms.TextInput):
+    # Text input that suggests the values already entered for ``field``, see
+    # the autocomplete script in base.html
+    def __init__(self, field, attrs=None):
+        super().__init__({
+            'data-autocomplete': reverse_lazy('autocomplete', args=[field]),
+            'autocomplete': 'off',
+            **(attrs or {}),
+        })
+
 class OrderForm(forms.ModelForm):
     class Meta:
         model = Order
@@ -13,6 +24,7 @@ class OrderForm(forms.ModelForm):
                   'rate', 'order_date']
         widgets = {
             'order_date': forms.DateInput(attrs={'type': 'date', 'placeholder': 'YYYY-MM-DD'}),
+            'order_received_from': AutocompleteInput('order_received_from'),
         }
 
 class FabricPurchasedForm(forms.ModelForm):
@@ -23,6 +35,9 @@ class FabricPurchasedForm(forms.ModelForm):
         widgets = {
             'fabric_purchase_date': forms.DateInput(attrs={'type': 'date', 'placeholder': 'YYYY-MM-DD'}),
             'issued_challan_date': forms.DateInput(attrs={'type': 'date', 'placeholder': 'YYYY-MM-DD'}),
+            'purchased_from': AutocompleteInput('purchased_from'),
+            'fabric_detail': AutocompleteInput('fabric_detail'),
+            'fabric_dyer': AutocompleteInput('dyer_printer_name'),
         }
 
 class PrintingAndDyeingSentForm(forms.ModelForm):
@@ -32,6 +47,8 @@ class PrintingAndDyeingSentForm(forms.ModelForm):
                   'fabric_length', 'issued_challan_quantity']
         widgets = {
             'issued_challan_date': forms.DateInput(attrs={'type': 'date', 'placeholder': 'YYYY-MM-DD'}),
+            'dyer_printer_name': AutocompleteInput('dyer_printer_name'),
+            'fabric_detail': AutocompleteInput('fabric_detail'),
         }
 
 class PrintingAndDyeingReceivedForm(forms.ModelForm):
@@ -52,6 +69,8 @@ class ClothCuttingForm(forms.ModelForm):
         widgets = {
             'issued_challan_date': forms.DateInput(attrs={'type': 'date', 'placeholder': 'YYYY-MM-DD'}),
             'received_date': forms.DateInput(attrs={'type': 'date', 'placeholder': 'YYYY-MM-DD'}),
+            'job_worker_name': AutocompleteInput('job_worker_name'),
+            'fabric_detail': AutocompleteInput('fabric_detail'),
         }
 
 class StitchingForm(forms.ModelForm):
@@ -61,6 +80,7 @@ class StitchingForm(forms.ModelForm):
                   'issued_challan_quantity', 'received_quantity', 'rate']
         widgets = {
             'issued_challan_date': forms.DateInput(attrs={'type': 'date', 'placeholder': 'YYYY-MM-DD'}),
+            'job_worker_name': AutocompleteInput('job_worker_name'),
         }
 
 class ExtraWorkForm(forms.ModelForm):
@@ -70,6 +90,7 @@ class ExtraWorkForm(forms.ModelForm):
                   'issued_challan_quantity', 'received_quantity', 'rate']
         widgets = {
             'issued_challan_date': forms.DateInput(attrs={'type': 'date', 'placeholder': 'YYYY-MM-DD'}),
+            'job_worker_name': AutocompleteInput('job_worker_name'),
         }
 
 class FinishingAndPackingForm(forms.ModelForm):
@@ -79,6 +100,7 @@ class FinishingAndPackingForm(forms.ModelForm):
                   'packed_quantity', 'rate']
         widgets = {
             'issued_challan_date': forms.DateInput(attrs={'type': 'date', 'placeholder': 'YYYY-MM-DD'}),
+            'job_worker_name': AutocompleteInput('job_worker_name'),
         }
 
 class DispatchForm(forms.ModelForm):
@@ -87,6 +109,7 @@ class DispatchForm(forms.ModelForm):
         fields = ['dispatch_date', 'dispatched_to', 'quantity', 'delivery_note', 'invoice_number', 'box_details']
         widgets = {
             'dispatch_date': forms.DateInput(attrs={'type': 'date', 'placeholder': 'YYYY-MM-DD'}),
+            'dispatched_to': AutocompleteInput('order_received_from'),
         }
     
     def __init__(self, *args, **kwargs):
@@ -108,3 +131,20 @@ class DispatchForm(forms.ModelForm):
         self.helper.form_method = 'post'
         self.helper.label_class = 'form-label'
         self.helper.field_class = 'form-control'
+
+def _import_model_choices():
+    from .imports import IMPORT_MODELS
+    return [(kind, kind.replace('_', ' ').capitalize()) for kind in IMPORT_MODELS]
+
+class ImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV file with a header line, or JSONL file with one record per line.')
+    model = forms.ChoiceField(
+        choices=_import_model_choices, initial='order',
+        help_text='Kind of record in rows without a "model" column. Stage records name their order id in an "order" column.',
+    )
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if not file.name.lower().endswith(('.csv', '.jsonl')):
+            raise forms.ValidationError('Upload a .csv or .jsonl file.')
+        return file
@@ -0,0 +1,258 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .autocomplete import add_on_save
+from .forms import OrderForm, FabricPurchasedForm, PrintingAndDyeingSentForm, PrintingAndDyeingReceivedForm, ClothCuttingForm, StitchingForm, ExtraWorkForm, FinishingAndPackingForm, DispatchForm
+from .models import DASHBOARD_CACHE_KEY, Order, FabricPurchased, PrintingAndDyeingSent, PrintingAndDyeingReceived, ClothCutting, Stitching, ExtraWork, FinishingAndPacking, Dispatch, bulk_advance_order_status, update_order_rollups_many
+from .order_stages import bump_order_versions
+from .routers import note_write
+from .search import index_records
+
+# Importable record kinds, in lifecycle order, with the form whose rules rows
+# are validated by. Stage rows name their order in an ``order`` column.
+IMPORT_MODELS = {
+    'order': (Order, OrderForm),
+    'fabric_purchased': (FabricPurchased, FabricPurchasedForm),
+    'printing_and_dyeing_sent': (PrintingAndDyeingSent, PrintingAndDyeingSentForm),
+    'printing_and_dyeing_received': (PrintingAndDyeingReceived, PrintingAndDyeingReceivedForm),
+    'cloth_cutting': (ClothCutting, ClothCuttingForm),
+    'stitching': (Stitching, StitchingForm),
+    'extra_work': (ExtraWork, ExtraWorkForm),
+    'finishing_and_packing': (FinishingAndPacking, FinishingAndPackingForm),
+    'dispatch': (Dispatch, DispatchForm),
+}
+
+# Stage records that may be added whatever the order's status, like the
+# add_extrawork view allows
+ANY_STATUS = {'extra_work'}
+
+IMPORT_BATCH_SIZE = 1000
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = {}
+        self.errors = []
+
+    def add_error(self, line, kind, field, message):
+        self.errors.append({'line': line, 'model': kind, 'field': field, 'message': message})
+
+    @property
+    def total_created(self):
+        return sum(self.created.values())
+
+    @property
+    def rejected_rows(self):
+        return len({error['line'] for error in self.errors})
+
+    def write_csv(self, fileobj):
+        writer = csv.DictWriter(fileobj, fieldnames=['line', 'model', 'field', 'message'])
+        writer.writeheader()
+        writer.writerows(self.errors)
+
+
+def read_rows(fileobj, file_format):
+    """
+    Yield ``(line number, row dict)`` from a CSV file with a header line or a
+    JSONL file with one object per line. ``fileobj`` is a text file.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(fileobj)
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == 'jsonl':
+        for line_number, line in enumerate(fileobj, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                row = error
+            yield line_number, row
+    else:
+        raise ValueError(f'Unknown import format {file_format!r}, use csv or jsonl.')
+
+
+def import_rows(rows, user=None, default_model='order', batch_size=IMPORT_BATCH_SIZE):
+    """
+    Validate ``(line number, row)`` pairs with the entry forms and bulk insert
+    the valid ones, ``batch_size`` rows per transaction. A row's ``model`` key
+    picks the kind of record (see IMPORT_MODELS), defaulting to
+    ``default_model``. Invalid rows are skipped and listed in the returned
+    ImportReport.
+    """
+    report = ImportReport()
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            break
+        _import_chunk(chunk, user, default_model, report)
+    return report
+
+
+def _import_chunk(chunk, user, default_model, report):
+    valid = {kind: [] for kind in IMPORT_MODELS}
+    forms = {}
+    for line, row in chunk:
+        if not isinstance(row, dict):
+            report.add_error(line, default_model, '', f'Not a valid row: {row}')
+            continue
+        row = dict(row)
+        kind = row.pop('model', None) or default_model
+        if kind not in IMPORT_MODELS:
+            report.add_error(line, kind, 'model', f'Unknown model, use one of {", ".join(IMPORT_MODELS)}.')
+            continue
+        if kind not in forms:
+            forms[kind] = IMPORT_MODELS[kind][1](data={})
+        instance = _validate(line, kind, row, forms[kind], report)
+        if instance is not None:
+            instance.user = user
+            valid[kind].append((line, instance))
+
+    with transaction.atomic():
+        if valid['order']:
+            _create_orders([instance for _, instance in valid['order']], report)
+        order_ids = {instance.order_id for kind, items in valid.items() if kind != 'order' for _, instance in items}
+        # Locked, so the statuses rows are checked against can't change before
+        # the chunk is committed
+        statuses = dict(Order.objects.select_for_update().filter(id__in=order_ids).values_list('id', 'status'))
+        # Stage kinds in lifecycle order, so an order can move through several
+        # stages within one chunk
+        for kind, items in valid.items():
+            if kind != 'order' and items:
+                _create_stage_records(kind, items, statuses, report)
+
+
+def _validate(line, kind, row, form, report):
+    model = form._meta.model
+    order_id = row.pop('order', None)
+    # Columns left out take the model's defaults, as they would in the entry forms
+    for name in form._meta.fields:
+        if row.get(name) in (None, '') and model._meta.get_field(name).has_default():
+            row[name] = model._meta.get_field(name).get_default()
+    # Building a form copies all its fields, which costs more than validating a
+    # row, so one form per kind is rebound to each row instead
+    form.data = row
+    form.instance = model()
+    form._errors = None
+    if not form.is_valid():
+        for field, errors in form.errors.items():
+            for error in errors:
+                report.add_error(line, kind, field, error)
+        return None
+    instance = form.save(commit=False)
+    if kind != 'order':
+        try:
+            instance.order_id = int(order_id)
+        except (TypeError, ValueError):
+            report.add_error(line, kind, 'order', 'An order id is required.')
+            return None
+    return instance
+
+
+def _create_orders(orders, report):
+    for order in orders:
+        order.set_calculated_fields()
+    Order.objects.bulk_create(orders)
+    update_order_rollups_many((None, order._rollup_values()) for order in orders)
+    for order in orders:
+        order._loaded_values = order._rollup_values()
+    _after_bulk_create(Order, orders)
+    transaction.on_commit(lambda: cache.delete(DASHBOARD_CACHE_KEY))
+    report.created['order'] = report.created.get('order', 0) + len(orders)
+
+
+def _create_stage_records(kind, items, statuses, report):
+    model = IMPORT_MODELS[kind][0]
+    from_status, to_status = model.status_transition
+
+    accepted = []
+    # Orders an earlier row of this chunk already moves on
+    claimed = set()
+    for line, instance in items:
+        status = to_status if instance.order_id in claimed else statuses.get(instance.order_id)
+        if status is None:
+            report.add_error(line, kind, 'order', f'Order {instance.order_id} does not exist.')
+        elif kind not in ANY_STATUS and status != from_status:
+            report.add_error(line, kind, 'order', f'Order {instance.order_id} has status "{status}", not "{from_status}".')
+        else:
+            accepted.append((line, instance))
+            if status == from_status:
+                claimed.add(instance.order_id)
+
+    if model is PrintingAndDyeingReceived:
+        accepted = _link_sent_records(kind, accepted, report)
+    if not accepted:
+        return
+
+    advanced = set(bulk_advance_order_status(
+        {instance.order_id for _, instance in accepted if statuses[instance.order_id] == from_status},
+        from_status, to_status,
+    ))
+    for order_id in advanced:
+        statuses[order_id] = to_status
+    if kind not in ANY_STATUS:
+        for line, instance in accepted:
+            if instance.order_id not in advanced:
+                report.add_error(line, kind, 'order', f'Order {instance.order_id} no longer has status "{from_status}".')
+        accepted = [(line, instance) for line, instance in accepted if instance.order_id in advanced]
+        if not accepted:
+            return
+
+    instances = [instance for _, instance in accepted]
+    for instance in instances:
+        if hasattr(instance, 'set_calculated_fields'):
+            instance.set_calculated_fields()
+    order_ids = {instance.order_id for instance in instances}
+    model.objects.bulk_create(instances)
+    if model is PrintingAndDyeingReceived:
+        PrintingAndDyeingSent.objects.filter(
+            id__in=[instance.printing_and_dyeing_sent_id for instance in instances]
+        ).update(received=True, updated_at=timezone.now())
+    _after_bulk_create(model, instances)
+    transaction.on_commit(lambda: bump_order_versions(order_ids))
+    report.created[kind] = report.created.get(kind, 0) + len(instances)
+
+
+def _link_sent_records(kind, accepted, report):
+    # Received records belong to the order's first sent record, which must not be
+    # received yet, as in the add_printinganddyeingreceived view
+    sent_records = {}
+    for sent in PrintingAndDyeingSent.objects.filter(
+        order_id__in={instance.order_id for _, instance in accepted}
+    ).order_by('-id'):
+        sent_records[sent.order_id] = sent
+    linked = []
+    for line, instance in accepted:
+        sent = sent_records.get(instance.order_id)
+        if sent is None:
+            report.add_error(line, kind, 'order', f'Order {instance.order_id} has no printing and dyeing sent record.')
+        elif sent.received:
+            report.add_error(line, kind, 'order', f'Order {instance.order_id} has already been received from printing and dyeing.')
+        else:
+            instance.printing_and_dyeing_sent = sent
+            sent.received = True
+            linked.append((line, instance))
+    return linked
+
+
+def _after_bulk_create(model, instances):
+    # bulk_create() sends no post_save signals, so do their work here
+    index_records(instances)
+    for instance in instances:
+        add_on_save(model, instance)
+    note_write(model)
+
+
+def import_file(fileobj, file_format, user=None, default_model='order', batch_size=IMPORT_BATCH_SIZE):
+    """Import a binary or text file object, see import_rows()."""
+    if isinstance(fileobj.read(0), bytes):
+        fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    return import_rows(read_rows(fileobj, file_format), user, default_model, batch_size)
@@ -0,0 +1,138 @@
+import io
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+
+from mainapp.dashboard import build_dashboard_snapshot, get_status_groups
+from mainapp.models import Order, FabricPurchased
+
+
+class Command(BaseCommand):
+    help = ('Measure mixed read/write throughput of the order views\' queries on a generated SQLite '
+            'database, with SQLite\'s defaults and with the SQLITE_PRAGMAS profile')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000,
+                            help='Number of orders in the generated dataset')
+        parser.add_argument('--readers', type=int, default=4,
+                            help='Threads loading the dashboard and the order listing')
+        parser.add_argument('--writers', type=int, default=2,
+                            help='Threads adding orders and fabric purchases')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Seconds each profile is measured for')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The benchmark needs the default database to be SQLite')
+
+        database = connections.settings['default']
+        saved = {'NAME': database['NAME'], 'OPTIONS': database['OPTIONS']}
+        workdir = tempfile.mkdtemp(prefix='kms-benchmark-')
+        try:
+            dataset = os.path.join(workdir, 'dataset.sqlite3')
+            self.stdout.write(f'Generating {options["orders"]} orders...')
+            self._use_database(dataset, {})
+            call_command('migrate', verbosity=0)
+            call_command('generate_fake_data', orders=options['orders'], users=3, stdout=io.StringIO())
+
+            results = []
+            for profile, profile_options in (('defaults', {}), ('tuned', settings.SQLITE_TUNED_OPTIONS)):
+                # Every profile starts from a copy of the same dataset
+                path = os.path.join(workdir, f'{profile}.sqlite3')
+                shutil.copy(dataset, path)
+                self._use_database(path, profile_options)
+                results.append((profile, self._run(options)))
+        finally:
+            self._use_database(saved['NAME'], saved['OPTIONS'])
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(f'{"profile":<10}{"reads/s":>10}{"writes/s":>10}{"read p95 ms":>13}{"write p95 ms":>14}{"locked":>8}')
+        for profile, result in results:
+            self.stdout.write(
+                f'{profile:<10}{result["reads"] / result["elapsed"]:>10.1f}{result["writes"] / result["elapsed"]:>10.1f}'
+                f'{result["read_p95"]:>13.1f}{result["write_p95"]:>14.1f}{result["locked"]:>8}'
+            )
+
+    def _use_database(self, name, options):
+        # Point the default alias at another file, the way the test runner swaps
+        # in the test database; threads started afterwards connect to it
+        connections.close_all()
+        database = connections.settings['default']
+        database['NAME'] = name
+        database['OPTIONS'] = options
+
+    def _run(self, options):
+        order_ids = list(Order.objects.values_list('id', flat=True))
+        user_id = Order.objects.exclude(user=None).values_list('user_id', flat=True).first()
+        connections.close_all()
+
+        deadline = time.monotonic() + options['duration']
+        timings = {'reads': [], 'writes': []}
+        locked = []
+        lock = threading.Lock()
+
+        def worker(kind, operation):
+            rng = random.Random()
+            own_timings = []
+            own_locked = 0
+            try:
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        operation(rng)
+                    except OperationalError:
+                        own_locked += 1
+                        continue
+                    own_timings.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+            with lock:
+                timings[kind].extend(own_timings)
+                locked.append(own_locked)
+
+        def read(rng):
+            build_dashboard_snapshot()
+            get_status_groups()
+            list(Order.objects.order_by('-order_date', '-id')[:settings.ORDER_PAGE_SIZE])
+            list(Order.objects.filter(id=rng.choice(order_ids)))
+
+        def write(rng):
+            order = Order.objects.create(
+                po_number=f'BENCH-{rng.randrange(10 ** 6)}', style_id=f'B{rng.randrange(10 ** 6)}',
+                order_received_from='Benchmark', quantity_m=rng.randint(10, 100), rate=100, user_id=user_id,
+            )
+            FabricPurchased.objects.create(
+                order=order, purchased_from='Benchmark Mill', quantity=50, rate=20, invoice_number='BENCH',
+                fabric_detail='Cotton', fabric_length='44"', fabric_dyer='Benchmark Dyer', user_id=user_id,
+            )
+
+        threads = [threading.Thread(target=worker, args=('reads', read)) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=('writes', write)) for _ in range(options['writers'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return {
+            'elapsed': time.monotonic() - started,
+            'reads': len(timings['reads']),
+            'writes': len(timings['writes']),
+            'read_p95': self._p95(timings['reads']),
+            'write_p95': self._p95(timings['writes']),
+            'locked': sum(locked),
+        }
+
+    def _p95(self, timings):
+        if not timings:
+            return 0
+        timings = sorted(timings)
+        return timings[int(len(timings) * 0.95)] * 1000
@@ -1,309 +1,168 @@
-# yourapp/management/commands/export_orders.py
-
 import csv
 import os
+import shutil
 import datetime
-from django.core.management.base import BaseCommand
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
-from django.db import models
-from mainapp.models import (
-    Order, FabricPurchased, PrintingAndDyeing, ClothCutting, 
-    Stitching, ExtraWork, FinishingAndPacking, Dispatch
+from django.utils import timezone
+
+from mainapp.models import Order
+from mainapp.processes import worker_processes
+from mainapp.profiling import ProfiledCommandMixin
+from mainapp.routers import replica_reads
+from mainapp.exports import (
+    get_header, get_max_extra_works, get_order_row, get_watermark, set_watermark,
+    touched_since, with_stage_records
 )
 
-class Command(BaseCommand):
+
+def export_shard(part_path, first_id, last_id, max_extra_works, batch_size, since=None, use_replica=False):
+    """
+    Write the orders with ``first_id <= id <= last_id`` to ``part_path`` (no header),
+    walking the id range with keyset pagination. With ``since`` only orders touched
+    after that time are written. Returns the number of rows written.
+    """
+    with replica_reads() if use_replica else nullcontext():
+        return _write_shard(part_path, first_id, last_id, max_extra_works, batch_size, since)
+
+
+def _write_shard(part_path, first_id, last_id, max_extra_works, batch_size, since):
+    orders = Order.objects.all()
+    if since is not None:
+        orders = touched_since(orders, since)
+
+    written = 0
+    cursor = first_id - 1
+    with open(part_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        while True:
+            batch = list(with_stage_records(
+                orders.filter(id__gt=cursor, id__lte=last_id).order_by('id')
+            )[:batch_size])
+            if not batch:
+                break
+            writer.writerows(get_order_row(order, max_extra_works) for order in batch)
+            written += len(batch)
+            cursor = batch[-1].id
+    return written
+
+
+class Command(ProfiledCommandMixin, BaseCommand):
     help = 'Export all orders with their associated data to a CSV file'
 
     def add_arguments(self, parser):
-        parser.add_argument('--output', type=str, default=f'orders_export_{str(datetime.datetime.now().timestamp()).replace(" ", "_")}.csv',
+        parser.add_argument('--output', type=str, default=f'orders_export_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
                             help='Filename for the CSV export')
         parser.add_argument('--path', type=str, default=None,
                             help='Path to save the CSV file (defaults to MEDIA_ROOT/exports)')
         parser.add_argument('--batch-size', type=int, default=1000,
-                            help='Number of records to process in each batch')
+                            help='Number of orders fetched per query')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of processes exporting disjoint id shards in parallel')
+        parser.add_argument('--delta', action='store_true',
+                            help='Only export orders changed since the last export to the same destination. '
+                                 'Orders changed within EXPORT_WATERMARK_OVERLAP seconds before it are exported '
+                                 'again, so deltas may repeat rows; deleted orders are never included.')
+        parser.add_argument('--consumer', type=str, default=None,
+                            help='Name the --delta watermark is stored under (defaults to the output file path)')
 
     def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        workers = options['workers']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if workers < 1:
+            raise CommandError('--workers must be at least 1.')
+
         # Determine the file path
         filename = options['output']
         if options['path']:
             export_path = options['path']
         else:
             export_path = os.path.join(settings.MEDIA_ROOT, 'exports')
-        
+
         # Create directory if it doesn't exist
         os.makedirs(export_path, exist_ok=True)
-        
         file_path = os.path.join(export_path, filename)
-        batch_size = options['batch_size']
-        
-        # Create field names for the CSV
-        field_names = self._get_field_names()
-        
-        # Count total orders for progress reporting
-        total_orders = Order.objects.count()
-        self.stdout.write(f'Starting export of {total_orders} orders')
-        
-        # Write to CSV file using batches
-        with open(file_path, 'w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=field_names)
-            
-            # Write header row
-            writer.writeheader()
-            
-            # Process in batches
-            processed = 0
-            
-            # Get the maximum order ID to use for batching
-            if total_orders > 0:
-                max_id = Order.objects.aggregate(models.Max('id'))['id__max']
-                
-                # Process in batches based on ID ranges
-                for start_id in range(0, max_id + 1, batch_size):
-                    end_id = min(start_id + batch_size - 1, max_id)
-                    
-                    # Query this batch of orders
-                    batch = Order.objects.filter(id__gte=start_id, id__lte=end_id)
-                    
-                    # Get all related data for this batch in a single query per model
-                    order_ids = list(batch.values_list('id', flat=True))
-                    
-                    # Query all related models for this batch
-                    fabrics = {item.order_id: item for item in 
-                              FabricPurchased.objects.filter(order_id__in=order_ids)}
-                    
-                    printings = {item.order_id: item for item in 
-                                PrintingAndDyeing.objects.filter(order_id__in=order_ids)}
-                    
-                    cuttings = {item.order_id: item for item in 
-                               ClothCutting.objects.filter(order_id__in=order_ids)}
-                    
-                    stitchings = {item.order_id: item for item in 
-                                 Stitching.objects.filter(order_id__in=order_ids)}
-                    
-                    extras = {item.order_id: item for item in 
-                             ExtraWork.objects.filter(order_id__in=order_ids)}
-                    
-                    finishings = {item.order_id: item for item in 
-                                 FinishingAndPacking.objects.filter(order_id__in=order_ids)}
-                    
-                    dispatches = {item.order_id: item for item in 
-                                 Dispatch.objects.filter(order_id__in=order_ids)}
-                    
-                    # Process each order in the batch
-                    for order in batch:
-                        # Get all data with efficient lookups
-                        row = self._get_order_data(
-                            order, 
-                            fabrics.get(order.id),
-                            printings.get(order.id),
-                            cuttings.get(order.id),
-                            stitchings.get(order.id),
-                            extras.get(order.id),
-                            finishings.get(order.id),
-                            dispatches.get(order.id)
-                        )
-                        writer.writerow(row)
-                        processed += 1
-                    
-                    # Report progress
-                    self.stdout.write(f'Processed {processed}/{total_orders} orders')
-            
+
+        # Full exports read from the replica when there is one. Delta exports
+        # read the primary, as a lagging copy would move the watermark past
+        # changes it never saw.
+        use_replica = not options['delta']
+        with replica_reads() if use_replica else nullcontext():
+            return self._export(file_path, batch_size, workers, use_replica, options)
+
+    def _export(self, file_path, batch_size, workers, use_replica, options):
+        # Taken before reading so changes made during the export are picked up next time
+        started_at = timezone.now()
+        orders = Order.objects.all()
+        since = None
+        if options['delta']:
+            consumer = options['consumer'] or os.path.abspath(file_path)
+            since = get_watermark(consumer)
+            if since is not None:
+                orders = touched_since(orders, since)
+                self.stdout.write(f'Exporting orders changed since {since} for {consumer}')
+            else:
+                self.stdout.write(f'No previous export for {consumer}, exporting all orders')
+
+        total_orders = orders.count()
+        max_extra_works = get_max_extra_works(orders)
+        self.stdout.write(f'Starting export of {total_orders} orders using {workers} worker(s)')
+
+        shards = self._get_shards(orders, total_orders, workers)
+        part_paths = [f'{file_path}.part{index}' for index in range(len(shards))]
+
+        try:
+            if workers == 1 or len(shards) <= 1:
+                counts = [
+                    export_shard(part_path, first_id, last_id, max_extra_works, batch_size, since, use_replica)
+                    for part_path, (first_id, last_id) in zip(part_paths, shards)
+                ]
+            else:
+                with worker_processes(workers) as executor:
+                    futures = [
+                        executor.submit(export_shard, part_path, first_id, last_id, max_extra_works, batch_size, since, use_replica)
+                        for part_path, (first_id, last_id) in zip(part_paths, shards)
+                    ]
+                    counts = []
+                    for index, future in enumerate(futures):
+                        counts.append(future.result())
+                        self.stdout.write(f'Shard {index + 1}/{len(shards)} exported {counts[-1]} orders')
+
+            # Merge the shards in id order behind a single header
+            with open(file_path, 'w', newline='') as csvfile:
+                csv.writer(csvfile).writerow(get_header(max_extra_works))
+                for part_path in part_paths:
+                    with open(part_path, newline='') as part:
+                        shutil.copyfileobj(part, csvfile)
+        finally:
+            for part_path in part_paths:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+        if options['delta']:
+            set_watermark(consumer, started_at)
+
+        processed = sum(counts)
         self.stdout.write(self.style.SUCCESS(f'Successfully exported {processed} orders to {file_path}'))
         return file_path
-    
-    def _get_field_names(self):
-        """Generate all field names for the CSV header"""
-        # Same as before - field definitions
-        # Order fields
-        fields = [
-            'order_id', 'order_date', 'style_id', 'order_received_from', 
-            'quantity', 'size', 'rate', 'status', 'amount'
-        ]
-        
-        # FabricPurchased fields
-        fields.extend([
-            'fabric_purchase_date', 'purchased_from', 'fabric_quantity', 
-            'fabric_rate', 'fabric_amount', 'invoice_number', 'fabric_detail',
-            'fabric_length', 'fabric_dyer', 'challan_number', 'issued_challan_date',
-            'fabric_issued_challan_quantity', 'balance_fabric'
-        ])
-        
-        # Add all other fields like before...
-        # (including all fields from PrintingAndDyeing, ClothCutting, etc.)
-        # Fields for other models would go here, same as original implementation
-        
-        # PrintingAndDyeing fields
-        fields.extend([
-            'print_issued_challan_date', 'print_issued_challan_number', 
-            'dyer_printer_name', 'print_fabric_detail', 'print_fabric_length',
-            'print_issued_challan_quantity', 'shrinkage_in_percentage',
-            'print_received_quantity', 'print_balance_quantity', 
-            'print_received_date', 'print_received_challan_number',
-            'print_rate', 'print_amount'
-        ])
-        
-        # ClothCutting fields
-        fields.extend([
-            'cut_issued_challan_date', 'cut_issued_challan_number',
-            'cut_job_worker_name', 'cut_fabric_detail', 'cut_fabric_length',
-            'cut_issued_challan_quantity', 'cut_received_quantity',
-            'cut_balance_quantity', 'cut_received_date', 
-            'cut_received_challan_number', 'cut_rate', 'cut_amount'
-        ])
-        
-        # Stitching fields
-        fields.extend([
-            'stitch_issued_challan_date', 'stitch_issued_challan_number',
-            'stitch_job_worker_name', 'stitch_issued_challan_quantity',
-            'stitch_received_quantity', 'stitch_balance_quantity',
-            'stitch_received_date', 'stitch_rate', 'stitch_amount'
-        ])
-        
-        # ExtraWork fields
-        fields.extend([
-            'extra_issued_challan_date', 'extra_issued_challan_number',
-            'extra_job_worker_name', 'extra_work_name', 
-            'extra_issued_challan_quantity', 'extra_received_quantity',
-            'extra_balance_quantity', 'extra_rate', 'extra_amount',
-            'extra_received_date'
-        ])
-        
-        # FinishingAndPacking fields
-        fields.extend([
-            'finish_issued_challan_date', 'finish_issued_challan_number',
-            'finish_job_worker_name', 'finish_issued_challan_quantity',
-            'packed_quantity', 'rejected', 'finish_rate', 'finish_amount'
-        ])
-        
-        # Dispatch fields
-        fields.extend([
-            'dispatch_date', 'dispatched_to', 'dispatch_quantity',
-            'delivery_note', 'dispatch_invoice_number'
-        ])
-        
-        return fields
-    
-    def _get_order_data(self, order, fabric=None, printing=None, cutting=None, 
-                        stitching=None, extra=None, finishing=None, dispatch=None):
-        """Get all data for an order and its related models"""
-        # Start with order data
-        data = {
-            'order_id': order.id,
-            'order_date': order.order_date,
-            'style_id': order.style_id,
-            'order_received_from': order.order_received_from,
-            'quantity': order.quantity,
-            'size': order.size,
-            'rate': order.rate,
-            'status': order.status,
-            'amount': order.amount
-        }
-        
-        # Initialize all fields with empty values first
-        # This is more efficient than setting each field separately in the else clauses
-        for field in self._get_field_names()[8:]:  # Skip the order fields we already set
-            data[field] = ""
-        
-        # Update with related model data if available
-        if fabric:
-            data.update({
-                'fabric_purchase_date': fabric.fabric_purchase_date,
-                'purchased_from': fabric.purchased_from,
-                'fabric_quantity': fabric.quantity,
-                'fabric_rate': fabric.rate,
-                'fabric_amount': fabric.amount,
-                'invoice_number': fabric.invoice_number,
-                'fabric_detail': fabric.fabric_detail,
-                'fabric_length': fabric.fabric_length,
-                'fabric_dyer': fabric.fabric_dyer,
-                'challan_number': fabric.challan_number,
-                'issued_challan_date': fabric.issued_challan_date,
-                'fabric_issued_challan_quantity': fabric.issued_challan_quantity,
-                'balance_fabric': fabric.balance_fabric
-            })
-        
-        if printing:
-            data.update({
-                'print_issued_challan_date': printing.issued_challan_date,
-                # 'print_issued_challan_number': printing.issued_challan_number,
-                'dyer_printer_name': printing.dyer_printer_name,
-                'print_fabric_detail': printing.fabric_detail,
-                'print_fabric_length': printing.fabric_length,
-                'print_issued_challan_quantity': printing.issued_challan_quantity,
-                'shrinkage_in_percentage': printing.shrinkage_in_percentage,
-                'print_received_quantity': printing.received_quantity,
-                'print_balance_quantity': printing.balance_quantity,
-                'print_received_date': printing.received_date,
-                'print_received_challan_number': printing.received_challan_number,
-                'print_rate': printing.rate,
-                'print_amount': printing.amount
-            })
-        
-        # Add all other model data the same way
-        # This follows the same pattern for all remaining models
-        
-        if cutting:
-            data.update({
-                'cut_issued_challan_date': cutting.issued_challan_date,
-                'cut_issued_challan_number': cutting.issued_challan_number,
-                'cut_job_worker_name': cutting.job_worker_name,
-                'cut_fabric_detail': cutting.fabric_detail,
-                'cut_fabric_length': cutting.fabric_length,
-                'cut_issued_challan_quantity': cutting.issued_challan_quantity,
-                'cut_received_quantity': cutting.received_quantity,
-                'cut_balance_quantity': cutting.balance_quantity,
-                'cut_received_date': cutting.received_date,
-                'cut_received_challan_number': cutting.received_challan_number,
-                'cut_rate': cutting.rate,
-                'cut_amount': cutting.amount
-            })
-        
-        if stitching:
-            data.update({
-                'stitch_issued_challan_date': stitching.issued_challan_date,
-                'stitch_issued_challan_number': stitching.issued_challan_number,
-                'stitch_job_worker_name': stitching.job_worker_name,
-                'stitch_issued_challan_quantity': stitching.issued_challan_quantity,
-                'stitch_received_quantity': stitching.received_quantity,
-                'stitch_balance_quantity': stitching.balance_quantity,
-                'stitch_received_date': stitching.received_date,
-                'stitch_rate': stitching.rate,
-                'stitch_amount': stitching.amount
-            })
-        
-        if extra:
-            data.update({
-                'extra_issued_challan_date': extra.issued_challan_date,
-                'extra_issued_challan_number': extra.issued_challan_number,
-                'extra_job_worker_name': extra.job_worker_name,
-                'extra_work_name': extra.extra_work_name,
-                'extra_issued_challan_quantity': extra.issued_challan_quantity,
-                'extra_received_quantity': extra.received_quantity,
-                'extra_balance_quantity': extra.balance_quantity,
-                'extra_rate': extra.rate,
-                'extra_amount': extra.amount,
-                'extra_received_date': extra.received_date
-            })
-        
-        if finishing:
-            data.update({
-                'finish_issued_challan_date': finishing.issued_challan_date,
-                'finish_issued_challan_number': finishing.issued_challan_number,
-                'finish_job_worker_name': finishing.job_worker_name,
-                'finish_issued_challan_quantity': finishing.issued_challan_quantity,
-                'packed_quantity': finishing.packed_quantity,
-                'rejected': finishing.rejected,
-                'finish_rate': finishing.rate,
-                'finish_amount': finishing.amount
-            })
-        
-        if dispatch:
-            data.update({
-                'dispatch_date': dispatch.dispatch_date,
-                'dispatched_to': dispatch.dispatched_to,
-                'dispatch_quantity': dispatch.quantity,
-                'delivery_note': dispatch.delivery_note,
-                'dispatch_invoice_number': dispatch.invoice_number
-            })
-        
-        return data
\ No newline at end of file
+
+    def _get_shards(self, orders, total_orders, workers):
+        """
+        Split the orders into at most ``workers`` contiguous (first_id, last_id)
+        ranges holding roughly the same number of orders, so gaps in the id
+        sequence don't leave some workers idle.
+        """
+        if total_orders == 0:
+            return []
+        ids = orders.order_by('id').values_list('id', flat=True)
+        shard_count = min(workers, total_orders)
+        shard_size = -(-total_orders // shard_count)
+        shards = []
+        for start in range(0, total_orders, shard_size):
+            end = min(start + shard_size, total_orders) - 1
+            shards.append((ids[start], ids[end]))
+        return shards
@@ -1,9 +1,17 @@
-from django.core.management.base import BaseCommand
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
 from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.db import models
+from django.db.models import Max
 from django.utils import timezone
 from faker import Faker
 import random
+import string
+import time
 from datetime import timedelta, datetime
+from decimal import Decimal
 import calendar
 
 from mainapp.models import (
@@ -17,8 +25,214 @@ from mainapp.models import (
     FinishingAndPacking,
     Dispatch
 )
+from mainapp.search import is_supported as search_is_supported
+from mainapp.processes import worker_processes
+from mainapp.profiling import ProfiledCommandMixin
 
-class Command(BaseCommand):
+# Stage records in lifecycle order. In --bulk mode an order gets at most one
+# record of each, so their ids can be derived from the order id.
+BULK_STAGE_MODELS = [
+    FabricPurchased, PrintingAndDyeingSent, PrintingAndDyeingReceived, ClothCutting,
+    Stitching, ExtraWork, FinishingAndPacking, Dispatch,
+]
+BULK_MODELS = [Order] + BULK_STAGE_MODELS
+
+# Size of the name pools --bulk mode draws companies from; a few hundred
+# recurring customers and suppliers, like a real order book
+BULK_NAME_POOL_SIZE = 300
+
+# Share of the orders old enough to be dispatched that stop at an earlier stage
+BULK_STALLED_SHARE = 0.05
+
+
+def _money(rng, low, high):
+    return Decimal(rng.randint(low * 100, high * 100)).scaleb(-2)
+
+
+def _code(rng, prefix, letters=0, digits=6):
+    return prefix + ''.join(rng.choices(string.ascii_uppercase, k=letters)) + f'{rng.randrange(10 ** digits):0{digits}d}'
+
+
+def _fabric_length(rng):
+    return f'{rng.randint(40, 60)}"{rng.choice(["", "/", "x"])}{rng.randint(40, 60)}"'
+
+
+def _received_date(rng, issued_date, low, high, last_day):
+    # Goods come back a few days after the challan, but never after today
+    return min(issued_date + timedelta(days=rng.randint(low, high)), last_day)
+
+
+def _db_values(model, db):
+    """
+    Return a function turning an instance of ``model`` into the row tuple
+    inserted for it. Ints, strings and booleans go to the driver as they are;
+    only dates, times and decimals take the slower get_db_prep_save().
+    """
+    plain = (models.IntegerField, models.CharField, models.TextField, models.BooleanField, models.ForeignKey)
+    converters = [
+        (field.attname, None if isinstance(field, plain) else field.get_db_prep_save)
+        for field in model._meta.concrete_fields
+    ]
+
+    def values(instance):
+        row = []
+        for attname, convert in converters:
+            value = getattr(instance, attname)
+            row.append(value if convert is None or value is None else convert(value, db))
+        return tuple(row)
+    return values
+
+
+def generate_block(first_order_id, count, seed, id_shifts, pools, user_ids, first_day, last_day):
+    """
+    Generate ``count`` orders with ids from ``first_order_id`` on, and their stage
+    records, without touching the database. A stage record's id is its order's
+    id plus ``id_shifts[model label]``. The same arguments always give the same
+    rows. Returns ``{model label: [row tuples of concrete field db values]}``.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    db = connections['default']
+    db_values = {model._meta.label: _db_values(model, db) for model in BULK_MODELS}
+    span = (last_day - first_day).days
+    records = {model._meta.label: [] for model in BULK_MODELS}
+
+    for order_id in range(first_order_id, first_order_id + count):
+        order_date = first_day + timedelta(days=rng.randint(0, span))
+        order = Order(
+            id=order_id,
+            order_date=order_date,
+            po_number=_code(rng, 'PO-'),
+            style_id=_code(rng, 'STY-', letters=2, digits=3),
+            order_received_from=rng.choice(pools['customers']),
+            rate=rng.randint(Command.ORDER_RATE_MIN, Command.ORDER_RATE_MAX),
+            user_id=rng.choice(user_ids) if user_ids else None,
+            updated_at=now,
+            **Command._generate_size_distribution(
+                rng.randint(Command.ORDER_QUANTITY_MIN, Command.ORDER_QUANTITY_MAX), rng
+            )
+        )
+        order.set_calculated_fields()
+
+        # Orders go through the stages whose dates have passed; a few older
+        # ones are left stuck at some earlier stage
+        dates = []
+        current = order_date
+        for low, high in (
+            (Command.FABRIC_PURCHASE_DAYS_MIN, Command.FABRIC_PURCHASE_DAYS_MAX),
+            (Command.PRINTING_DYEING_DAYS_MIN, Command.PRINTING_DYEING_DAYS_MAX),
+            (2, 5),
+            (Command.CLOTH_CUTTING_DAYS_MIN, Command.CLOTH_CUTTING_DAYS_MAX),
+            (Command.STITCHING_DAYS_MIN, Command.STITCHING_DAYS_MAX),
+            (Command.EXTRA_WORK_DAYS_MIN, Command.EXTRA_WORK_DAYS_MAX),
+            (Command.FINISHING_PACKING_DAYS_MIN, Command.FINISHING_PACKING_DAYS_MAX),
+            (Command.DISPATCH_DAYS_MIN, Command.DISPATCH_DAYS_MAX),
+        ):
+            current += timedelta(days=rng.randint(low, high))
+            if current > last_day:
+                break
+            dates.append(current)
+        if len(dates) == len(BULK_STAGE_MODELS) and rng.random() < BULK_STALLED_SHARE:
+            dates = dates[:rng.randrange(len(dates))]
+
+        stage_records = _generate_stage_records(rng, order, dates, id_shifts, pools, user_ids, now, last_day)
+        if stage_records:
+            order.status = type(stage_records[-1]).status_transition[1]
+        for instance in [order] + stage_records:
+            records[instance._meta.label].append(db_values[instance._meta.label](instance))
+    return records
+
+
+def _generate_stage_records(rng, order, dates, id_shifts, pools, user_ids, now, last_day):
+    stage_records = []
+
+    quantity = order.quantity
+    for model, date in zip(BULK_STAGE_MODELS, dates):
+        fields = {
+            'id': order.id + id_shifts[model._meta.label],
+            'order_id': order.id,
+            'user_id': rng.choice(user_ids) if user_ids else None,
+            'updated_at': now,
+        }
+        if model is FabricPurchased:
+            quantity = int(quantity * rng.uniform(Command.FABRIC_QUANTITY_FACTOR_MIN, Command.FABRIC_QUANTITY_FACTOR_MAX))
+            instance = FabricPurchased(
+                fabric_purchase_date=date, purchased_from=rng.choice(pools['suppliers']), quantity=quantity,
+                rate=_money(rng, Command.FABRIC_RATE_MIN, Command.FABRIC_RATE_MAX),
+                invoice_number=_code(rng, 'INV-'), fabric_detail=rng.choice(Command.FABRIC_TYPES),
+                fabric_length=_fabric_length(rng), fabric_dyer=rng.choice(pools['dyers']), **fields
+            )
+        elif model is PrintingAndDyeingSent:
+            quantity = int(quantity * rng.uniform(0.9, 1.0))
+            sent = instance = PrintingAndDyeingSent(
+                issued_challan_date=date, dyer_printer_name=rng.choice(pools['dyers']),
+                fabric_detail=rng.choice(Command.FABRIC_TYPES), fabric_length=_fabric_length(rng),
+                issued_challan_quantity=quantity, **fields
+            )
+        elif model is PrintingAndDyeingReceived:
+            sent.received = True
+            instance = PrintingAndDyeingReceived(
+                printing_and_dyeing_sent=sent, received_date=date,
+                shrinkage_in_percentage=_money(rng, int(Command.SHRINKAGE_MIN), int(Command.SHRINKAGE_MAX)),
+                received_challan_number=_code(rng, 'RCV-'),
+                rate=_money(rng, Command.DYEING_RATE_MIN, Command.DYEING_RATE_MAX), **fields
+            )
+            instance.set_calculated_fields()
+            quantity = instance.received_quantity
+        elif model is ClothCutting:
+            received = int(quantity * rng.uniform(Command.CUTTING_YIELD_FACTOR_MIN, Command.CUTTING_YIELD_FACTOR_MAX))
+            instance = ClothCutting(
+                issued_challan_date=date, issued_challan_number=_code(rng, 'CUT-'),
+                job_worker_name=rng.choice(pools['job_workers']), fabric_detail=rng.choice(Command.FABRIC_TYPES),
+                fabric_length=_fabric_length(rng), issued_challan_quantity=quantity, received_quantity=received,
+                received_date=_received_date(rng, date, 1, 3, last_day), received_challan_number=_code(rng, 'RCV-'),
+                rate=_money(rng, Command.CUTTING_RATE_MIN, Command.CUTTING_RATE_MAX), **fields
+            )
+            quantity = received
+        elif model is Stitching:
+            received = int(quantity * rng.uniform(Command.STITCHING_YIELD_FACTOR_MIN, Command.STITCHING_YIELD_FACTOR_MAX))
+            instance = Stitching(
+                issued_challan_date=date, issued_challan_number=_code(rng, 'STI-'),
+                job_worker_name=rng.choice(pools['job_workers']), issued_challan_quantity=quantity,
+                received_quantity=received, received_date=_received_date(rng, date, 3, 7, last_day),
+                rate=_money(rng, Command.STITCHING_RATE_MIN, Command.STITCHING_RATE_MAX), **fields
+            )
+            quantity = received
+        elif model is ExtraWork:
+            received = int(quantity * rng.uniform(Command.EXTRA_WORK_YIELD_FACTOR_MIN, Command.EXTRA_WORK_YIELD_FACTOR_MAX))
+            instance = ExtraWork(
+                issued_challan_date=date, issued_challan_number=_code(rng, 'EXT-'),
+                job_worker_name=rng.choice(pools['job_workers']), extra_work_name=rng.choice(Command.EXTRA_WORK_TYPES),
+                issued_challan_quantity=quantity, received_quantity=received,
+                received_date=_received_date(rng, date, 2, 5, last_day),
+                rate=_money(rng, Command.EXTRA_WORK_RATE_MIN, Command.EXTRA_WORK_RATE_MAX), **fields
+            )
+            quantity = received
+        elif model is FinishingAndPacking:
+            packed = int(quantity * rng.uniform(Command.FINISHING_YIELD_FACTOR_MIN, Command.FINISHING_YIELD_FACTOR_MAX))
+            instance = FinishingAndPacking(
+                issued_challan_date=date, issued_challan_number=_code(rng, 'FIN-'),
+                job_worker_name=rng.choice(pools['job_workers']), issued_challan_quantity=quantity,
+                packed_quantity=packed, rate=_money(rng, Command.FINISHING_RATE_MIN, Command.FINISHING_RATE_MAX),
+                **fields
+            )
+            quantity = packed
+        else:
+            boxes = max(1, quantity // 50)
+            instance = Dispatch(
+                dispatch_date=date, dispatched_to=rng.choice(pools['customers']), quantity=quantity,
+                delivery_note=_code(rng, 'DN-'), invoice_number=_code(rng, 'INV-'),
+                box_details='\n'.join(
+                    f'Box {box + 1}: {quantity // boxes + (box < quantity % boxes)} pieces' for box in range(boxes)
+                ),
+                **fields
+            )
+        if hasattr(instance, 'set_calculated_fields'):
+            instance.set_calculated_fields()
+        stage_records.append(instance)
+    return stage_records
+
+class Command(ProfiledCommandMixin, BaseCommand):
     help = 'Generates fake data for clothing production management system'
     
     # Configuration variables
@@ -105,9 +319,21 @@ class Command(BaseCommand):
         parser.add_argument('--user', type=str, default=None, help='Username to associate with records')
         parser.add_argument('--complete', action='store_true', help='Generate complete lifecycle for some orders')
         parser.add_argument('--users', type=int, default=self.DEFAULT_NUM_USERS, help='Number of sample users to create')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for the random data, to generate the same dataset again')
+        parser.add_argument('--bulk', action='store_true',
+                            help='Generate rows in memory and insert them in batches, for large datasets')
+        parser.add_argument('--years', type=float, default=1,
+                            help='With --bulk, spread order dates over this many years up to today')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='With --bulk, number of processes generating rows in parallel')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='With --bulk, number of orders generated and inserted together')
 
     def handle(self, *args, **options):
         fake = Faker()
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+            fake.seed_instance(options['seed'])
         num_orders = options['orders']
         specified_user = None
         
@@ -166,6 +392,10 @@ class Command(BaseCommand):
             
             self.stdout.write(self.style.SUCCESS(f'Successfully created/loaded {len(users)} users'))
         
+        if options['bulk']:
+            self._generate_bulk(num_orders, users, fake, options)
+            return
+
         # Get current month's date range
         today = datetime.now()
         first_day = datetime(today.year, today.month, 1)
@@ -229,7 +459,99 @@ class Command(BaseCommand):
         
         self.stdout.write(self.style.SUCCESS(f'Successfully generated data for {num_orders} orders within {today.strftime("%B %Y")}'))
 
-    def _generate_size_distribution(self, total_quantity):
+    def _generate_bulk(self, num_orders, users, fake, options):
+        """Insert ``num_orders`` orders and their stage records in batches, see generate_block()"""
+        batch_size = options['batch_size']
+        workers = options['workers']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if workers < 1:
+            raise CommandError('--workers must be at least 1.')
+
+        last_day = timezone.localdate()
+        first_day = last_day - timedelta(days=max(0, int(options['years'] * 365) - 1))
+        seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+        # The name pools too come from the printed seed, so rerunning with
+        # --seed rebuilds the same dataset
+        fake.seed_instance(seed)
+        pools = {
+            # order_received_from holds at most 20 characters
+            'customers': [fake.company()[:20] for _ in range(BULK_NAME_POOL_SIZE)],
+            'suppliers': [fake.company() for _ in range(BULK_NAME_POOL_SIZE)],
+            'dyers': [fake.company() for _ in range(BULK_NAME_POOL_SIZE)],
+            'job_workers': [fake.company() for _ in range(BULK_NAME_POOL_SIZE)],
+        }
+        user_ids = [user.id for user in users]
+
+        # New rows get ids after the existing ones, so stage records can point
+        # at their orders without reading the ids back
+        first_order_id = (Order.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        id_shifts = {
+            model._meta.label: (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1 - first_order_id
+            for model in BULK_STAGE_MODELS
+        }
+        blocks = [
+            (first_order_id + start, min(batch_size, num_orders - start), seed + index, id_shifts, pools,
+             user_ids, first_day, last_day)
+            for index, start in enumerate(range(0, num_orders, batch_size))
+        ]
+        self.stdout.write(
+            f'Generating {num_orders} orders from {first_day} to {last_day} in {len(blocks)} batches '
+            f'using {workers} worker(s), seed {seed}...'
+        )
+
+        started = time.monotonic()
+        inserted = 0
+        if workers == 1 or len(blocks) <= 1:
+            for block in blocks:
+                inserted += self._insert_block(generate_block(*block))
+                self.stdout.write(f'Inserted {inserted} orders ({time.monotonic() - started:.0f}s)')
+        else:
+            with worker_processes(workers) as executor:
+                # Keep a couple of batches per worker in flight, so generating
+                # runs ahead of inserting without holding every row in memory
+                pending = []
+                for block in blocks:
+                    pending.append(executor.submit(generate_block, *block))
+                    if len(pending) > workers * 2:
+                        inserted += self._insert_block(pending.pop(0).result())
+                        self.stdout.write(f'Inserted {inserted} orders ({time.monotonic() - started:.0f}s)')
+                for future in pending:
+                    inserted += self._insert_block(future.result())
+                    self.stdout.write(f'Inserted {inserted} orders ({time.monotonic() - started:.0f}s)')
+
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), BULK_MODELS):
+                cursor.execute(sql)
+        # Inserting rows directly skips what Order.save() and the post_save
+        # signals keep up to date
+        call_command('rebuild_rollups', stdout=self.stdout)
+        if search_is_supported():
+            call_command('rebuild_search_index', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully generated {inserted} orders in {time.monotonic() - started:.0f}s'
+        ))
+
+    def _insert_block(self, records):
+        # Plain multi-row INSERTs of the prepared values: bulk_create() would
+        # spend more time building the statements than the database spends
+        # running them
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in BULK_MODELS:
+                rows = records[model._meta.label]
+                if not rows:
+                    continue
+                columns = ', '.join(connection.ops.quote_name(field.column) for field in model._meta.concrete_fields)
+                placeholders = ', '.join(['%s'] * len(model._meta.concrete_fields))
+                cursor.executemany(
+                    f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) VALUES ({placeholders})',
+                    rows,
+                )
+        return len(records[Order._meta.label])
+
+    @staticmethod
+    def _generate_size_distribution(total_quantity, rng=random):
         """Generate realistic size distribution for order quantities"""
         # Common size distribution weights (M and L are most common)
         size_weights = {
@@ -259,7 +581,7 @@ class Command(BaseCommand):
             else:
                 qty = int(total_quantity * weight)
                 # Add some randomness
-                qty = max(0, qty + random.randint(-5, 5))
+                qty = max(0, qty + rng.randint(-5, 5))
                 qty = min(qty, remaining)
                 quantities[size_field] = qty
                 remaining -= qty
@@ -267,7 +589,7 @@ class Command(BaseCommand):
         # Distribute any remaining quantity to popular sizes
         popular_sizes = ['quantity_m', 'quantity_l', 'quantity_xl']
         while remaining > 0:
-            size = random.choice(popular_sizes)
+            size = rng.choice(popular_sizes)
             quantities[size] += 1
             remaining -= 1
             
@@ -0,0 +1,54 @@
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp.imports import IMPORT_BATCH_SIZE, IMPORT_MODELS, import_file
+
+
+class Command(BaseCommand):
+    help = 'Import orders and stage records from a CSV or JSONL file, validated like the entry forms'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='CSV file with a header line, or JSONL file with one record per line')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='File format, by default taken from the file extension')
+        parser.add_argument('--model', choices=list(IMPORT_MODELS), default='order',
+                            help='Kind of record in rows without a "model" column')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                            help='Number of rows validated and inserted per transaction')
+        parser.add_argument('--user', help='Username recorded as the creator of the imported records')
+        parser.add_argument('--report', help='Write the rejected rows and their errors to this CSV file')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or os.path.splitext(options['file'])[1].lstrip('.').lower()
+        if file_format not in ('csv', 'jsonl'):
+            raise CommandError('Cannot tell the file format from its extension, pass --format')
+
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f'No user named {options["user"]}')
+
+        started = time.monotonic()
+        with open(options['file'], encoding='utf-8-sig', newline='') as file:
+            report = import_file(file, file_format, user, options['model'], options['batch_size'])
+        elapsed = time.monotonic() - started
+
+        for kind, count in report.created.items():
+            self.stdout.write(f'{kind}: {count}')
+        if options['report']:
+            with open(options['report'], 'w', newline='') as file:
+                report.write_csv(file)
+        elif report.errors:
+            for error in report.errors[:20]:
+                self.stdout.write(f'line {error["line"]}: {error["model"]} {error["field"]}: {error["message"]}')
+            if len(report.errors) > 20:
+                self.stdout.write(f'... and {len(report.errors) - 20} more, pass --report to get them all')
+
+        style = self.style.WARNING if report.errors else self.style.SUCCESS
+        self.stdout.write(style(
+            f'Imported {report.total_created} records in {elapsed:.1f}s, rejected {report.rejected_rows} rows'
+        ))
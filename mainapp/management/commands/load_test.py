@@ -0,0 +1,285 @@
+import http.client
+import io
+import json
+import random
+import tempfile
+import threading
+import time
+from datetime import date
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from mainapp.models import Order
+
+# Requests per URL name, relative weights. Reads dominate, as in the office;
+# addorder and addfabricpurchased stand in for stage entry.
+DEFAULT_MIX = {
+    'index': 20,
+    'orderdetail': 25,
+    'filter_by_status': 15,
+    'search_orders': 12,
+    'track_dyers': 5,
+    'export_orders_csv': 1,
+    'addorder': 8,
+    'addfabricpurchased': 10,
+}
+
+STATUS_SLUGS = [
+    'all', 'pending', 'fabric_purchased', 'printing_and_dyeing_sent', 'printing_and_dyeing_received',
+    'cloth_cutting', 'stitching', 'extra_work', 'finishing_and_packing', 'dispatched',
+]
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Workload:
+    """What the clients pick their requests from, shared by all client threads."""
+
+    def __init__(self):
+        self.order_ids = list(Order.objects.values_list('id', flat=True))
+        if not self.order_ids:
+            raise CommandError('The database has no orders to load test with')
+        self.pending_ids = list(Order.objects.filter(status='Pending').values_list('id', flat=True))
+        customers = Order.objects.values_list('order_received_from', flat=True).distinct()[:200]
+        self.search_terms = [customer.split()[0] for customer in customers if customer.split()]
+        self.search_terms += list(Order.objects.values_list('style_id', flat=True)[:200])
+        self.lock = threading.Lock()
+
+    def request(self, name, rng):
+        """Return ``(method, path, form data)`` for a request to the view ``name``."""
+        if name == 'index':
+            return 'GET', reverse('index'), None
+        if name == 'orderdetail':
+            return 'GET', reverse('orderdetail', args=[rng.choice(self.order_ids)]), None
+        if name == 'filter_by_status':
+            return 'GET', reverse('filter_by_status', args=[rng.choice(STATUS_SLUGS)]), None
+        if name == 'search_orders':
+            return 'GET', reverse('search_orders') + '?' + urlencode({'search': rng.choice(self.search_terms)}), None
+        if name == 'track_dyers':
+            return 'GET', reverse('track_dyers'), None
+        if name == 'export_orders_csv':
+            return 'POST', reverse('export_orders_csv', args=['m']), {}
+        if name == 'addorder':
+            return 'POST', reverse('addorder'), {
+                'po_number': f'LT-{rng.randrange(10 ** 6)}', 'style_id': f'LT{rng.randrange(10 ** 5)}',
+                'order_received_from': 'Load Test', 'quantity_m': rng.randint(10, 200),
+                'quantity_l': rng.randint(10, 200), 'rate': rng.randint(100, 500),
+                'order_date': date.today().isoformat(),
+            }
+        if name == 'addfabricpurchased':
+            # Each pending order takes one purchase; once they run out the view
+            # gets orders in other states and answers with its error redirect
+            with self.lock:
+                order_id = self.pending_ids.pop() if self.pending_ids else rng.choice(self.order_ids)
+            return 'POST', reverse('addfabricpurchased', args=[order_id]), {
+                'fabric_purchase_date': date.today().isoformat(), 'purchased_from': 'Load Test Mill',
+                'quantity': rng.randint(50, 500), 'rate': rng.randint(50, 200), 'invoice_number': 'LT',
+                'fabric_detail': 'Cotton', 'fabric_length': '44"', 'fabric_dyer': 'Load Test Dyer',
+            }
+        raise CommandError(f'Unknown URL name in --mix: {name}')
+
+
+class Command(BaseCommand):
+    help = ('Load test the order views: seed a throwaway database, serve the WSGI app locally and '
+            'report throughput and p50/p95/p99 latency per URL name under concurrent clients')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=5000,
+                            help='Number of orders in the seeded dataset')
+        parser.add_argument('--clients', type=int, default=20,
+                            help='Number of concurrent clients')
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Seconds to run the load for')
+        parser.add_argument('--mix', type=str, default=None,
+                            help='Request mix as comma separated name=weight pairs, e.g. "index=5,orderdetail=10" '
+                                 f'(default: {",".join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items())})')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed for the dataset and the request sequence')
+        parser.add_argument('--url', type=str, default=None,
+                            help='Load test an already running server at this base URL, using the configured '
+                                 'database as it is instead of a seeded one')
+        parser.add_argument('--username', type=str, default='admin',
+                            help='Staff user the clients are logged in as')
+        parser.add_argument('--json', type=str, default=None,
+                            help='Also write the results to this JSON file')
+        parser.add_argument('--baseline', type=str, default=None,
+                            help='JSON results of an earlier run to compare against; fails when a URL\'s p95 '
+                                 'latency got worse by more than --max-regression')
+        parser.add_argument('--max-regression', type=float, default=0.2,
+                            help='Tolerated p95 latency increase over --baseline, as a fraction')
+
+    def handle(self, *args, **options):
+        mix = self._parse_mix(options['mix']) if options['mix'] else DEFAULT_MIX
+        if options['clients'] < 1:
+            raise CommandError('--clients must be at least 1.')
+
+        if options['url']:
+            results = self._run(options['url'], mix, options)
+        else:
+            results = self._run_local(mix, options)
+
+        self._report(results)
+        if options['json']:
+            with open(options['json'], 'w') as file:
+                json.dump(results, file, indent=2)
+        if options['baseline']:
+            self._compare(results, options['baseline'], options['max_regression'])
+
+    def _parse_mix(self, value):
+        mix = {}
+        for part in value.split(','):
+            name, _, weight = part.partition('=')
+            name = name.strip()
+            if name not in DEFAULT_MIX:
+                raise CommandError(f'Unknown URL name in --mix: {name}, use one of {", ".join(DEFAULT_MIX)}')
+            try:
+                mix[name] = float(weight) if weight else 1
+            except ValueError:
+                raise CommandError(f'Invalid weight for {name} in --mix: {weight}')
+        return mix
+
+    def _run_local(self, mix, options):
+        # A throwaway database, set up the way the test runner does it; SQLite
+        # gets a file so the server threads don't share one in-memory database
+        workdir = tempfile.TemporaryDirectory(prefix='kms-loadtest-')
+        database = connections.settings['default']
+        if database['ENGINE'].endswith('sqlite3'):
+            database.setdefault('TEST', {})['NAME'] = f'{workdir.name}/loadtest.sqlite3'
+        old_config = setup_databases(verbosity=0, interactive=False, serialized_aliases=set())
+        try:
+            self.stdout.write(f'Seeding {options["orders"]} orders...')
+            call_command('generate_fake_data', bulk=True, orders=options['orders'], users=3, seed=options['seed'],
+                         years=2, stdout=self.stdout if options['verbosity'] > 1 else io.StringIO())
+            connections.close_all()
+
+            server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler, allow_reuse_address=False)
+            server.set_app(WSGIHandler())
+            server.daemon_threads = True
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                with override_settings(ALLOWED_HOSTS=['127.0.0.1']):
+                    return self._run(f'http://127.0.0.1:{server.server_port}', mix, options)
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+        finally:
+            connections.close_all()
+            teardown_databases(old_config, verbosity=0)
+            workdir.cleanup()
+
+    def _run(self, base_url, mix, options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f'No user named {options["username"]}')
+        workload = Workload()
+
+        # Log in once and share the session; the CSRF cookie and header carry
+        # the same token, which is all CsrfViewMiddleware checks for
+        client = Client()
+        client.force_login(user)
+        csrf_token = get_random_string(32)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}; ' \
+                 f'{settings.CSRF_COOKIE_NAME}={csrf_token}'
+        connections.close_all()
+
+        target = urlsplit(base_url)
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        timings = {name: [] for name in names}
+        errors = {name: 0 for name in names}
+        lock = threading.Lock()
+        self.stdout.write(f'Running {options["clients"]} clients against {base_url} for {options["duration"]:.0f}s...')
+        deadline = time.monotonic() + options['duration']
+
+        def run_client(index):
+            rng = random.Random(f'{options["seed"]}-{index}')
+            own_timings = {name: [] for name in names}
+            own_errors = {name: 0 for name in names}
+            while time.monotonic() < deadline:
+                name = rng.choices(names, weights)[0]
+                method, path, data = workload.request(name, rng)
+                headers = {'Cookie': cookie, 'Host': target.netloc}
+                body = None
+                if method == 'POST':
+                    body = urlencode(data)
+                    headers['Content-Type'] = 'application/x-www-form-urlencoded'
+                    headers['X-CSRFToken'] = csrf_token
+                started = time.perf_counter()
+                try:
+                    connection = http.client.HTTPConnection(target.hostname, target.port, timeout=60)
+                    connection.request(method, target.path.rstrip('/') + path, body=body, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    failed = response.status >= 400
+                    connection.close()
+                except (OSError, http.client.HTTPException):
+                    failed = True
+                own_timings[name].append(time.perf_counter() - started)
+                own_errors[name] += failed
+            with lock:
+                for name in names:
+                    timings[name].extend(own_timings[name])
+                    errors[name] += own_errors[name]
+
+        threads = [threading.Thread(target=run_client, args=(index,)) for index in range(options['clients'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        results = {}
+        for name in names + ['total']:
+            samples = sorted(sum(timings.values(), []) if name == 'total' else timings[name])
+            results[name] = {
+                'requests': len(samples),
+                'errors': sum(errors.values()) if name == 'total' else errors[name],
+                'rps': len(samples) / elapsed,
+                'p50': self._percentile(samples, 50),
+                'p95': self._percentile(samples, 95),
+                'p99': self._percentile(samples, 99),
+            }
+        return results
+
+    def _percentile(self, samples, percent):
+        # Nearest rank, in milliseconds
+        if not samples:
+            return 0
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100))] * 1000
+
+    def _report(self, results):
+        self.stdout.write(f'{"url name":<20}{"requests":>10}{"errors":>8}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<20}{result["requests"]:>10}{result["errors"]:>8}{result["rps"]:>9.1f}'
+                f'{result["p50"]:>9.1f}{result["p95"]:>9.1f}{result["p99"]:>9.1f}'
+            )
+
+    def _compare(self, results, baseline_path, max_regression):
+        with open(baseline_path) as file:
+            baseline = json.load(file)
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before and before['p95'] and result['p95'] > before['p95'] * (1 + max_regression):
+                regressions.append(f'{name}: p95 {before["p95"]:.1f} ms -> {result["p95"]:.1f} ms')
+        if regressions:
+            raise CommandError('Latency regressions against the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No latency regressions against the baseline'))
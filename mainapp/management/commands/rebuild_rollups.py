@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from mainapp.models import rebuild_order_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily and per customer order rollup tables from the orders table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rollup rows inserted per query')
+
+    def handle(self, *args, **options):
+        daily, customers = rebuild_order_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {daily} daily and {customers} customer rollup rows'
+        ))
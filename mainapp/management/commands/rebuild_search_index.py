@@ -0,0 +1,26 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from mainapp.search import create_search_table, is_supported, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of orders and their stage records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Number of index rows inserted per query')
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            raise CommandError('The full-text search index needs an SQLite database with FTS5')
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                create_search_table(cursor)
+            indexed = rebuild_search_index(
+                lambda name: apps.get_model('mainapp', name), batch_size=options['batch_size']
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} records'))
@@ -0,0 +1,52 @@
+import os
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from mainapp.routers import REPLICA_ALIAS, replica_configured
+
+
+class Command(BaseCommand):
+    help = ('Copy the SQLite database to the replica snapshot (SQLITE_REPLICA_PATH) with the SQLite '
+            'backup API, once or every --interval seconds')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep refreshing the snapshot every this many seconds')
+
+    def handle(self, *args, **options):
+        if not replica_configured():
+            raise CommandError('No replica database is configured; set SQLITE_REPLICA_PATH.')
+        primary = connections['default'].settings_dict
+        replica = connections[REPLICA_ALIAS].settings_dict
+        if primary['ENGINE'] != 'django.db.backends.sqlite3' or replica['ENGINE'] != primary['ENGINE']:
+            raise CommandError('Snapshots are only supported for a SQLite primary and replica.')
+
+        while True:
+            started = time.monotonic()
+            self._refresh(str(primary['NAME']), str(replica['NAME']))
+            self.stdout.write(f'Refreshed {replica["NAME"]} in {time.monotonic() - started:.2f}s')
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
+
+    def _refresh(self, primary_path, replica_path):
+        # Back up into a new file and swap it in, so readers never see a half
+        # copied snapshot; connections of other processes that are already open
+        # finish on the old file, whose journal mode doesn't leave -wal/-shm
+        # files next to it
+        snapshot_path = f'{replica_path}.refreshing'
+        source = sqlite3.connect(primary_path)
+        target = sqlite3.connect(snapshot_path)
+        try:
+            source.backup(target)
+            # A standalone file, readable without the primary's -wal/-shm files
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+            source.close()
+        connections[REPLICA_ALIAS].close()
+        os.replace(snapshot_path, replica_path)
+        connections[REPLICA_ALIAS].close()
@@ -0,0 +1,77 @@
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SORT_KEYS = {
+    'total': lambda group: group['total_ms'],
+    'count': lambda group: group['count'],
+    'mean': lambda group: group['total_ms'] / group['count'],
+    'max': lambda group: group['max_ms'],
+}
+
+
+class Command(BaseCommand):
+    help = 'Sum up slow query logs per query fingerprint, slowest in total first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*',
+                            help='Slow query log files (default: SLOW_QUERY_LOG)')
+        parser.add_argument('--top', type=int, default=20,
+                            help='Number of fingerprints to show')
+        parser.add_argument('--sort', choices=list(SORT_KEYS), default='total',
+                            help='Order fingerprints by total, count, mean or max time')
+        parser.add_argument('--url-name', type=str, default=None,
+                            help='Only count queries made by this URL name')
+        parser.add_argument('--plans', action='store_true',
+                            help='Show the latest plan of each fingerprint')
+
+    def handle(self, *args, **options):
+        files = options['files'] or ([settings.SLOW_QUERY_LOG] if settings.SLOW_QUERY_LOG else [])
+        if not files:
+            raise CommandError('No log files given and SLOW_QUERY_LOG is not set.')
+
+        groups = {}
+        for path in files:
+            try:
+                with open(path) as file:
+                    for line in file:
+                        self._add(groups, line, options['url_name'])
+            except OSError as error:
+                raise CommandError(f'Cannot read {path}: {error}')
+        if not groups:
+            self.stdout.write('No slow queries logged.')
+            return
+
+        ranked = sorted(groups.values(), key=SORT_KEYS[options['sort']], reverse=True)[:options['top']]
+        self.stdout.write(f'{"fingerprint":<14}{"count":>8}{"total ms":>12}{"mean ms":>10}{"max ms":>10}  url names')
+        for group in ranked:
+            url_names = ', '.join(f'{name} ({count})' for name, count in group['url_names'].most_common(3))
+            self.stdout.write(
+                f'{group["fingerprint"]:<14}{group["count"]:>8}{group["total_ms"]:>12.1f}'
+                f'{group["total_ms"] / group["count"]:>10.1f}{group["max_ms"]:>10.1f}  {url_names}'
+            )
+            self.stdout.write(f'    {group["sql"]}')
+            if options['plans'] and group['plan']:
+                for step in group['plan']:
+                    self.stdout.write(f'      {step}')
+
+    def _add(self, groups, line, url_name):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return
+        if not isinstance(entry, dict) or entry.get('event') != 'slow_query':
+            return
+        if url_name and entry.get('url_name') != url_name:
+            return
+        group = groups.setdefault(entry['fingerprint'], {
+            'fingerprint': entry['fingerprint'], 'sql': entry['sql'], 'count': 0, 'total_ms': 0.0,
+            'max_ms': 0.0, 'url_names': Counter(), 'plan': None,
+        })
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+        group['url_names'][entry.get('url_name') or '-'] += 1
+        group['plan'] = entry.get('plan') or group['plan']
@@ -0,0 +1,127 @@
+# Prometheus metrics served at /metrics. Counters and histograms are kept by
+# prometheus_client; with PROMETHEUS_MULTIPROC_DIR set every worker process
+# writes them to files in that directory and a scrape adds them all up, so any
+# worker can answer it. Gauges of the current data are read from the database
+# when scraped.
+import os
+
+from django.core.cache import cache
+from django.db.models import Sum
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+REQUEST_LATENCY = Histogram(
+    'kms_request_duration_seconds', 'Time to answer a request, by URL name',
+    ['url_name', 'method'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUESTS = Counter(
+    'kms_requests_total', 'Requests answered, by URL name and status code',
+    ['url_name', 'method', 'status'],
+)
+REQUEST_QUERIES = Histogram(
+    'kms_request_queries', 'Database queries made by a request, by URL name',
+    ['url_name'],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+QUERY_LATENCY = Histogram(
+    'kms_db_query_duration_seconds', 'Time taken by a database query, by database alias',
+    ['alias'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+CACHE_LOOKUPS = Counter(
+    'kms_cache_lookups_total', 'Lookups of cached pages and snapshots, by cache and result',
+    ['cache', 'result'],
+)
+STATUS_TRANSITIONS = Counter(
+    'kms_order_status_transitions_total', 'Orders moved from one status to the next',
+    ['from_status', 'to_status'],
+)
+
+# Seconds the database gauges are reused for, so frequent scrapes don't keep
+# counting the stage tables
+GAUGE_CACHE_KEY = 'metrics_gauges'
+GAUGE_CACHE_TIMEOUT = 60
+
+
+def record_request(url_name, method, status, duration, queries):
+    url_name = url_name or 'unresolved'
+    REQUEST_LATENCY.labels(url_name, method).observe(duration)
+    REQUESTS.labels(url_name, method, str(status)).inc()
+    REQUEST_QUERIES.labels(url_name).observe(queries)
+
+
+def record_query(alias, duration):
+    QUERY_LATENCY.labels(alias).observe(duration)
+
+
+def record_cache_lookup(name, hit):
+    CACHE_LOOKUPS.labels(name, 'hit' if hit else 'miss').inc()
+
+
+def record_status_transition(from_status, to_status, count=1):
+    STATUS_TRANSITIONS.labels(from_status, to_status).inc(count)
+
+
+def init_status_transitions(statuses):
+    # Export every edge of the lifecycle from the start, at zero, so rates and
+    # alerts work before the first transition of a process
+    for from_status, to_status in zip(statuses, statuses[1:]):
+        STATUS_TRANSITIONS.labels(from_status, to_status)
+
+
+def _read_gauges():
+    from .models import DailyOrderRollup, PrintingAndDyeingSent, ClothCutting, Stitching, ExtraWork
+
+    orders = dict(
+        DailyOrderRollup.objects.values('status').annotate(total=Sum('order_count')).values_list('status', 'total')
+    )
+    # Challans whose goods haven't all come back from the job worker
+    outstanding = {
+        'printing_and_dyeing': PrintingAndDyeingSent.objects.filter(received=False).count(),
+        'cloth_cutting': ClothCutting.objects.filter(balance_quantity__gt=0).count(),
+        'stitching': Stitching.objects.filter(balance_quantity__gt=0).count(),
+        'extra_work': ExtraWork.objects.filter(balance_quantity__gt=0).count(),
+    }
+    return orders, outstanding
+
+
+class DatabaseCollector:
+    """Gauges of orders per status and outstanding challans per stage."""
+
+    def collect(self):
+        gauges = cache.get(GAUGE_CACHE_KEY)
+        if gauges is None:
+            gauges = _read_gauges()
+            cache.set(GAUGE_CACHE_KEY, gauges, GAUGE_CACHE_TIMEOUT)
+        orders, outstanding = gauges
+
+        order_gauge = GaugeMetricFamily('kms_orders', 'Orders currently in each status', labels=['status'])
+        for status, count in orders.items():
+            order_gauge.add_metric([status], count or 0)
+        yield order_gauge
+
+        challan_gauge = GaugeMetricFamily(
+            'kms_outstanding_challans', 'Issued challans not fully received back, by stage', labels=['stage']
+        )
+        for stage, count in outstanding.items():
+            challan_gauge.add_metric([stage], count)
+        yield challan_gauge
+
+
+class _ProcessCollector:
+    # This process's own metrics, including the process and platform metrics
+    # prometheus_client collects by default
+    def collect(self):
+        return REGISTRY.collect()
+
+
+def render_metrics():
+    """The exposition text of all metrics, summed over the worker processes."""
+    registry = CollectorRegistry()
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(_ProcessCollector())
+    registry.register(DatabaseCollector())
+    return generate_latest(registry)
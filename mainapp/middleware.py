@@ -0,0 +1,226 @@
+# Per request performance measurements: query count and SQL time, view time and
+# template render time, sent to the browser in a Server-Timing header, logged
+# for slow requests and recorded in the Prometheus metrics. Staff users can also
+# have a single request profiled.
+import json
+import logging
+import os
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.template.backends.django import Template
+
+from . import metrics
+from .profiling import SamplingProfiler, profile_path
+
+logger = logging.getLogger('mainapp.performance')
+
+_timer = ContextVar('request_timer', default=None)
+
+
+class RequestTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.url_name = None
+        self.view_started = None
+        self.view_time = 0.0
+        self.render_time = 0.0
+        self._render_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.sql_time += duration
+            self.queries += 1
+            metrics.record_query(context['connection'].alias, duration)
+
+    def recording(self):
+        """Context manager counting the queries made inside it, on every database."""
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(self.record_query))
+        return stack
+
+    def metrics(self):
+        return {
+            'queries': self.queries,
+            'sql_ms': round(self.sql_time * 1000, 1),
+            'view_ms': round(self.view_time * 1000, 1),
+            'render_ms': round(self.render_time * 1000, 1),
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 1),
+        }
+
+
+def current_url_name():
+    """URL name of the request being answered by this thread, if any."""
+    timer = _timer.get()
+    return timer.url_name if timer is not None else None
+
+
+# Django sends no signal when a template is rendered outside of tests, so the
+# template backend's render() is wrapped to time it
+_render = Template.render
+
+
+def _timed_render(self, context=None, request=None):
+    timer = _timer.get()
+    if timer is None:
+        return _render(self, context, request)
+    # Templates rendered while rendering another one are already being timed
+    timer._render_depth += 1
+    started = time.perf_counter()
+    try:
+        return _render(self, context, request)
+    finally:
+        timer._render_depth -= 1
+        if not timer._render_depth:
+            timer.render_time += time.perf_counter() - started
+
+
+Template.render = _timed_render
+
+
+class ServerTimingMiddleware:
+    """
+    Measure every request and add a Server-Timing header (when SERVER_TIMING is
+    on) with its SQL, view and render times. Requests slower than
+    SLOW_REQUEST_MS are logged to ``mainapp.performance`` as a JSON line tagged
+    with the URL name, and every request's latency and query count go to the
+    metrics. Streamed responses are recorded once fully sent.
+
+    Should come last in MIDDLEWARE, so the view time is the view's alone.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = RequestTimer()
+        token = _timer.set(timer)
+        try:
+            with timer.recording():
+                response = self.get_response(request)
+            if timer.view_started is not None:
+                timer.view_time = time.perf_counter() - timer.view_started
+        finally:
+            _timer.reset(token)
+
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = self._header(timer.metrics())
+        if getattr(response, 'streaming', False):
+            response.streaming_content = self._iter_timed(request, response, response.streaming_content, timer)
+        else:
+            self._finish(request, response, timer)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = _timer.get()
+        if timer is not None:
+            timer.url_name = request.resolver_match.view_name
+            timer.view_started = time.perf_counter()
+
+    def _iter_timed(self, request, response, content, timer):
+        # Streamed content runs its queries while being sent
+        try:
+            iterator = iter(content)
+            while True:
+                with timer.recording():
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        return
+                yield chunk
+        finally:
+            self._finish(request, response, timer)
+
+    def _header(self, metrics):
+        return ', '.join([
+            f'sql;dur={metrics["sql_ms"]};desc="{metrics["queries"]} queries"',
+            f'view;dur={metrics["view_ms"]}',
+            f'render;dur={metrics["render_ms"]}',
+            f'total;dur={metrics["total_ms"]}',
+        ])
+
+    def _finish(self, request, response, timer):
+        measured = timer.metrics()
+        match = request.resolver_match
+        url_name = match.view_name if match else None
+        metrics.record_request(
+            url_name, request.method, response.status_code, measured['total_ms'] / 1000, measured['queries']
+        )
+        if measured['total_ms'] < settings.SLOW_REQUEST_MS:
+            return
+        logger.warning(json.dumps({
+            'event': 'slow_request',
+            'url_name': url_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **measured,
+        }))
+
+
+class ProfilerMiddleware:
+    """
+    Run requests of staff users that ask for it, with ``?profile=1`` or an
+    ``X-Profile: 1`` header, under a SamplingProfiler. The flame graph file is
+    written under MEDIA_ROOT/profiles and named in the X-Profile response
+    header. Each user gets PROFILE_REQUESTS_PER_HOUR profiles an hour.
+
+    Must come after AuthenticationMiddleware.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        wanted = request.GET.get('profile') == '1' or request.headers.get('X-Profile') == '1'
+        if not wanted or not request.user.is_staff:
+            return self.get_response(request)
+        if not self._allow(request.user):
+            response = self.get_response(request)
+            response['X-Profile'] = 'rate limited'
+            return response
+
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            profiler.stop()
+            raise
+        match = request.resolver_match
+        path = profile_path(match.url_name if match else 'request')
+        response['X-Profile'] = os.path.relpath(path, settings.MEDIA_ROOT)
+        if getattr(response, 'streaming', False):
+            response.streaming_content = self._iter_profiled(response.streaming_content, profiler, path)
+        else:
+            self._save(profiler, path)
+        return response
+
+    def _allow(self, user):
+        key = f'profile_requests:{user.pk}:{int(time.time() // 3600)}'
+        cache.add(key, 0, 3600)
+        try:
+            return cache.incr(key) <= settings.PROFILE_REQUESTS_PER_HOUR
+        except ValueError:
+            # Expired in between
+            return False
+
+    def _iter_profiled(self, content, profiler, path):
+        # Streamed content does most of its work while being sent
+        try:
+            yield from content
+        finally:
+            self._save(profiler, path)
+
+    def _save(self, profiler, path):
+        profiler.stop()
+        profiler.save(path)
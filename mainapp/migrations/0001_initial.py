@@ -0,0 +1,248 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:40
+
+import datetime
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consumer', models.CharField(max_length=255, unique=True)),
+                ('exported_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CustomerOrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_received_from', models.CharField(max_length=20)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Fabric Purchased', 'Fabric Purchased'), ('Printing and Dyeing Sent', 'Printing and Dyeing Sent'), ('Printing and Dyeing Received', 'Printing and Dyeing Received'), ('Cloth Cutting', 'Cloth Cutting'), ('Stitching', 'Stitching'), ('Extra Work', 'Extra Work'), ('Finishing and Packing', 'Finishing and Packing'), ('Dispatched', 'Dispatched')], max_length=50)),
+                ('order_count', models.IntegerField(default=0)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('amount', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('order_received_from', 'status')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyOrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Fabric Purchased', 'Fabric Purchased'), ('Printing and Dyeing Sent', 'Printing and Dyeing Sent'), ('Printing and Dyeing Received', 'Printing and Dyeing Received'), ('Cloth Cutting', 'Cloth Cutting'), ('Stitching', 'Stitching'), ('Extra Work', 'Extra Work'), ('Finishing and Packing', 'Finishing and Packing'), ('Dispatched', 'Dispatched')], max_length=50)),
+                ('order_count', models.IntegerField(default=0)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('amount', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('day', 'status')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_date', models.DateField(default=datetime.date.today)),
+                ('po_number', models.CharField(default='', max_length=20)),
+                ('quantity_xs', models.IntegerField(default=0)),
+                ('quantity_s', models.IntegerField(default=0)),
+                ('quantity_m', models.IntegerField(default=0)),
+                ('quantity_l', models.IntegerField(default=0)),
+                ('quantity_xl', models.IntegerField(default=0)),
+                ('quantity_2xl', models.IntegerField(default=0)),
+                ('quantity_3xl', models.IntegerField(default=0)),
+                ('quantity_4xl', models.IntegerField(default=0)),
+                ('quantity_5xl', models.IntegerField(default=0)),
+                ('quantity_6xl', models.IntegerField(default=0)),
+                ('quantity_7xl', models.IntegerField(default=0)),
+                ('quantity_8xl', models.IntegerField(default=0)),
+                ('quantity_9xl', models.IntegerField(default=0)),
+                ('quantity_10xl', models.IntegerField(default=0)),
+                ('style_id', models.CharField(max_length=20)),
+                ('order_received_from', models.CharField(max_length=20)),
+                ('quantity', models.IntegerField()),
+                ('rate', models.IntegerField()),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Fabric Purchased', 'Fabric Purchased'), ('Printing and Dyeing Sent', 'Printing and Dyeing Sent'), ('Printing and Dyeing Received', 'Printing and Dyeing Received'), ('Cloth Cutting', 'Cloth Cutting'), ('Stitching', 'Stitching'), ('Extra Work', 'Extra Work'), ('Finishing and Packing', 'Finishing and Packing'), ('Dispatched', 'Dispatched')], default='Pending', max_length=50)),
+                ('amount', models.BigIntegerField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FinishingAndPacking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('issued_challan_date', models.DateField(default=datetime.date.today)),
+                ('issued_challan_number', models.CharField(max_length=50)),
+                ('job_worker_name', models.CharField(max_length=100)),
+                ('issued_challan_quantity', models.IntegerField()),
+                ('packed_quantity', models.IntegerField()),
+                ('rejected', models.IntegerField(blank=True)),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mainapp.order')),
+            ],
+            options={
+                'verbose_name_plural': 'Finishing and Packing',
+            },
+        ),
+        migrations.CreateModel(
+            name='FabricPurchased',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fabric_purchase_date', models.DateField(default=datetime.date.today)),
+                ('purchased_from', models.CharField(max_length=100)),
+                ('quantity', models.IntegerField(help_text='Quantity of fabric received after purchase.')),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10)),
+                ('invoice_number', models.CharField(max_length=50)),
+                ('fabric_detail', models.CharField(max_length=100)),
+                ('fabric_length', models.CharField(max_length=20)),
+                ('fabric_dyer', models.CharField(max_length=100)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mainapp.order')),
+            ],
+            options={
+                'verbose_name_plural': 'Fabric Purchased',
+            },
+        ),
+        migrations.CreateModel(
+            name='ExtraWork',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('issued_challan_date', models.DateField(default=datetime.date.today)),
+                ('issued_challan_number', models.CharField(max_length=50)),
+                ('job_worker_name', models.CharField(max_length=100)),
+                ('extra_work_name', models.CharField(max_length=100)),
+                ('issued_challan_quantity', models.IntegerField()),
+                ('received_quantity', models.IntegerField()),
+                ('balance_quantity', models.IntegerField(blank=True)),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10)),
+                ('received_date', models.DateField(default=datetime.date.today)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mainapp.order')),
+            ],
+            options={
+                'verbose_name_plural': 'Extra Work',
+            },
+        ),
+        migrations.CreateModel(
+            name='Dispatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dispatch_date', models.DateField(default=datetime.date.today)),
+                ('dispatched_to', models.CharField(max_length=100)),
+                ('quantity', models.IntegerField()),
+                ('delivery_note', models.CharField(blank=True, max_length=100, null=True)),
+                ('invoice_number', models.CharField(max_length=50)),
+                ('box_details', models.TextField(default='')),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mainapp.order')),
+            ],
+            options={
+                'verbose_name_plural': 'Dispatch',
+            },
+        ),
+        migrations.CreateModel(
+            name='ClothCutting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('issued_challan_date', models.DateField(default=datetime.date.today)),
+                ('issued_challan_number', models.CharField(max_length=50)),
+                ('job_worker_name', models.CharField(max_length=100)),
+                ('fabric_detail', models.CharField(max_length=100)),
+                ('fabric_length', models.CharField(max_length=20)),
+                ('issued_challan_quantity', models.IntegerField()),
+                ('received_quantity', models.IntegerField()),
+                ('balance_quantity', models.IntegerField(blank=True)),
+                ('received_date', models.DateField(default=datetime.date.today)),
+                ('received_challan_number', models.CharField(max_length=50)),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mainapp.order')),
+            ],
+            options={
+                'verbose_name_plural': 'Cloth Cutting',
+            },
+        ),
+        migrations.CreateModel(
+            name='PrintingAndDyeingSent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('issued_challan_date', models.DateField(default=datetime.date.today)),
+                ('dyer_printer_name', models.CharField(max_length=100)),
+                ('fabric_detail', models.CharField(max_length=100)),
+                ('fabric_length', models.CharField(max_length=20)),
+                ('issued_challan_quantity', models.IntegerField()),
+                ('received', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mainapp.order')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Printing and Dyeing Sent',
+            },
+        ),
+        migrations.CreateModel(
+            name='PrintingAndDyeingReceived',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shrinkage_in_percentage', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('received_quantity', models.IntegerField(default=0)),
+                ('balance_quantity', models.IntegerField(blank=True)),
+                ('received_date', models.DateField(default=datetime.date.today)),
+                ('received_challan_number', models.CharField(max_length=50)),
+                ('rate', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, default=0, max_digits=10)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mainapp.order')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('printing_and_dyeing_sent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mainapp.printinganddyeingsent')),
+            ],
+            options={
+                'verbose_name_plural': 'Printing and Dyeing Received',
+            },
+        ),
+        migrations.CreateModel(
+            name='Stitching',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('issued_challan_date', models.DateField(default=datetime.date.today)),
+                ('issued_challan_number', models.CharField(max_length=50)),
+                ('job_worker_name', models.CharField(max_length=100)),
+                ('issued_challan_quantity', models.IntegerField()),
+                ('received_quantity', models.IntegerField()),
+                ('balance_quantity', models.IntegerField(blank=True)),
+                ('received_date', models.DateField(default=datetime.date.today)),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mainapp.order')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Stitching',
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'order_date'], name='order_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_date', 'id'], name='order_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['style_id'], name='order_style_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_received_from'], name='order_received_from_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='printinganddyeingsent',
+            index=models.Index(fields=['received', 'dyer_printer_name'], name='pds_received_dyer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='printinganddyeingsent',
+            index=models.Index(condition=models.Q(('received', False)), fields=['dyer_printer_name', 'issued_challan_quantity'], name='pds_unreceived_dyer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='printinganddyeingsent',
+            index=models.Index(fields=['fabric_detail'], name='pds_fabric_detail_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+from mainapp.search import SEARCH_TABLE, create_search_table, is_supported, rebuild_search_index
+
+
+def create_search_index(apps, schema_editor):
+    using = schema_editor.connection.alias
+    if not is_supported(using):
+        return
+    create_search_table(schema_editor.connection.cursor())
+    rebuild_search_index(lambda name: apps.get_model('mainapp', name), using=using)
+
+
+def drop_search_index(apps, schema_editor):
+    if is_supported(schema_editor.connection.alias):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0002_order_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+from mainapp.models import rebuild_order_rollups
+
+
+def rebuild_rollups(apps, schema_editor):
+    # Databases created before the rollup tables were kept up to date start
+    # with correct ones
+    rebuild_order_rollups(lambda name: apps.get_model('mainapp', name), using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0003_order_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_rollups, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,19 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, F, Sum
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.utils import timezone
 import datetime
+from collections import defaultdict
 from math import floor
+from .metrics import record_status_transition
+
+# Cache key of the index view's dashboard counters, dropped whenever an order status changes
+DASHBOARD_CACHE_KEY = 'dashboard_snapshot'
+
+# Order fields the rollup tables are keyed and summed on
+ROLLUP_FIELDS = ('order_date', 'order_received_from', 'status', 'quantity', 'amount')
 
 # Create your models here.
 class Order(models.Model):
@@ -68,19 +79,53 @@ class Order(models.Model):
     )
     amount = models.BigIntegerField(blank=True)  # calculated field
 
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 
     def __str__(self):
         return f"Order # {self.style_id} - {self.order_received_from}"
 
-    def save(self, *args, **kwargs):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so save() can tell what changed
+        instance._loaded_values = instance._rollup_values()
+        return instance
+
+    def _rollup_values(self):
+        # Fields the dashboard snapshot and the rollup tables are derived from
+        return tuple(self.__dict__.get(field) for field in ROLLUP_FIELDS)
+
+    def set_calculated_fields(self):
         self.quantity = (self.quantity_xs + self.quantity_s + self.quantity_m +
                          self.quantity_l + self.quantity_xl + self.quantity_2xl +
                          self.quantity_3xl + self.quantity_4xl + self.quantity_5xl
                          + self.quantity_6xl + self.quantity_7xl + self.quantity_8xl +
                          self.quantity_9xl + self.quantity_10xl)
         self.amount = self.quantity * self.rate
-        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        loaded_values = None if self._state.adding else getattr(self, '_loaded_values', None)
+        self.set_calculated_fields()
+        track_rollups = self._state.adding or loaded_values is not None
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            values = self._rollup_values()
+            if track_rollups and values != loaded_values:
+                update_order_rollups(loaded_values, values)
+        if loaded_values is None or loaded_values[ROLLUP_FIELDS.index('status')] != self.status:
+            cache.delete(DASHBOARD_CACHE_KEY)
+        self._loaded_values = values
+
+    class Meta:
+        indexes = [
+            # Status filters, counted and listed newest first
+            models.Index(fields=['status', 'order_date'], name='order_status_date_idx'),
+            # Date range exports and keyset pagination on (order_date, id)
+            models.Index(fields=['order_date', 'id'], name='order_date_id_idx'),
+            models.Index(fields=['style_id'], name='order_style_id_idx'),
+            models.Index(fields=['order_received_from'], name='order_received_from_idx'),
+        ]
 
 class FabricPurchased(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
@@ -95,17 +140,23 @@ class FabricPurchased(models.Model):
     fabric_length = models.CharField(max_length=20)
     fabric_dyer = models.CharField(max_length=100)
 
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 
     def __str__(self):
         return f"Fabric Purchased for Order # {self.order.style_id}"
 
-    def save(self, *args, **kwargs):
+    # Order status moved from and to when a record is added
+    status_transition = ('Pending', 'Fabric Purchased')
+
+    def set_calculated_fields(self):
         self.amount = self.quantity * self.rate
-        if self.order.status == 'Pending':
-            self.order.status = 'Fabric Purchased'
-            self.order.save()
-        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.set_calculated_fields()
+        with transaction.atomic():
+            advance_stage_order(self)
+            super().save(*args, **kwargs)
 
     class Meta:
         verbose_name_plural = "Fabric Purchased"
@@ -127,19 +178,32 @@ class PrintingAndDyeingSent(models.Model):
     issued_challan_quantity = models.IntegerField()
     received = models.BooleanField(default=False)
     
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 
     def __str__(self):
         return f"Printing & Dyeing Sent for Order # {self.order.style_id}"
 
+    # Order status moved from and to when a record is added
+    status_transition = ('Fabric Purchased', 'Printing and Dyeing Sent')
+
     def save(self, *args, **kwargs):
-        if self.order.status == 'Fabric Purchased':
-            self.order.status = 'Printing and Dyeing Sent'
-            self.order.save()
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            advance_stage_order(self)
+            super().save(*args, **kwargs)
     
     class Meta:
         verbose_name_plural = "Printing and Dyeing Sent"
+        indexes = [
+            # Challans by received flag and dyer (searches and the admin filter)
+            models.Index(fields=['received', 'dyer_printer_name'], name='pds_received_dyer_idx'),
+            # Unreceived challans grouped by dyer in track_dyers. Partial, because
+            # received=False compiles to NOT received, which can't seek the index above
+            models.Index(fields=['dyer_printer_name', 'issued_challan_quantity'], condition=models.Q(received=False),
+                         name='pds_unreceived_dyer_idx'),
+            # Fabric lookups and grouping in search_orders and track_fabrics
+            models.Index(fields=['fabric_detail'], name='pds_fabric_detail_idx'),
+        ]
 
 class PrintingAndDyeingReceived(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
@@ -154,12 +218,16 @@ class PrintingAndDyeingReceived(models.Model):
     rate = models.DecimalField(default=0, max_digits=10, decimal_places=2)
     amount = models.DecimalField(default=0, max_digits=10, decimal_places=2, blank=True)  # calculated field
 
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 
     def __str__(self):
         return f"Printing & Dyeing Received for Order # {self.order.style_id}"
 
-    def save(self, *args, **kwargs):
+    # Order status moved from and to when a record is added
+    status_transition = ('Printing and Dyeing Sent', 'Printing and Dyeing Received')
+
+    def set_calculated_fields(self):
         # Get issued quantity from the related PrintingAndDyeingSent record
         issued_quantity = self.printing_and_dyeing_sent.issued_challan_quantity
         
@@ -167,18 +235,21 @@ class PrintingAndDyeingReceived(models.Model):
         self.received_quantity = floor(issued_quantity - (issued_quantity * self.shrinkage_in_percentage / 100))
         self.balance_quantity = issued_quantity - self.received_quantity
         self.amount = self.rate * self.received_quantity
-        
-        # Update order status
-        if self.order.status == 'Printing and Dyeing Sent':
-            self.order.status = 'Printing and Dyeing Received'
-            self.order.save()
-        
-        # Mark the associated PrintingAndDyeingSent record as received
-        if not self.printing_and_dyeing_sent.received:
-            self.printing_and_dyeing_sent.received = True
-            self.printing_and_dyeing_sent.save()
-        
-        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.set_calculated_fields()
+        with transaction.atomic():
+            advance_stage_order(self)
+
+            # Mark the associated PrintingAndDyeingSent record as received, writing
+            # only its flag
+            if not self.printing_and_dyeing_sent.received:
+                PrintingAndDyeingSent.objects.filter(id=self.printing_and_dyeing_sent_id).update(
+                    received=True, updated_at=timezone.now()
+                )
+                self.printing_and_dyeing_sent.received = True
+
+            super().save(*args, **kwargs)
     
     class Meta:
         verbose_name_plural = "Printing and Dyeing Received"
@@ -202,18 +273,24 @@ class ClothCutting(models.Model):
     rate = models.DecimalField(max_digits=10, decimal_places=2)
     amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True) # calculated field
 
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 
     def __str__(self):
         return f"Cloth Cutting for Order # {self.order.style_id}"
 
-    def save(self, *args, **kwargs):
+    # Order status moved from and to when a record is added
+    status_transition = ('Printing and Dyeing Received', 'Cloth Cutting')
+
+    def set_calculated_fields(self):
         self.balance_quantity = self.issued_challan_quantity - self.received_quantity
         self.amount = self.received_quantity * self.rate
-        if self.order.status == 'Printing and Dyeing Received':
-            self.order.status = 'Cloth Cutting'
-            self.order.save()
-        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.set_calculated_fields()
+        with transaction.atomic():
+            advance_stage_order(self)
+            super().save(*args, **kwargs)
     
     class Meta:
         verbose_name_plural = "Cloth Cutting"
@@ -234,18 +311,24 @@ class Stitching(models.Model):
     rate = models.DecimalField(max_digits=10, decimal_places=2)
     amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True) # calculated field
 
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 
     def __str__(self):
         return f"Stitching for Order # {self.order.style_id}"
 
-    def save(self, *args, **kwargs):
+    # Order status moved from and to when a record is added
+    status_transition = ('Cloth Cutting', 'Stitching')
+
+    def set_calculated_fields(self):
         self.balance_quantity = self.issued_challan_quantity - self.received_quantity
         self.amount = self.received_quantity * self.rate
-        if self.order.status == 'Cloth Cutting':
-            self.order.status = 'Stitching'
-            self.order.save()
-        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.set_calculated_fields()
+        with transaction.atomic():
+            advance_stage_order(self)
+            super().save(*args, **kwargs)
     
     class Meta:
         verbose_name_plural = "Stitching"
@@ -266,18 +349,25 @@ class ExtraWork(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True) # calculated field
     received_date = models.DateField(default=datetime.date.today)
 
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 
     def __str__(self):
         return f"Extra Work for Order # {self.order.style_id}"
     
-    def save(self, *args, **kwargs):
+    # Order status moved from and to when a record is added
+    status_transition = ('Stitching', 'Extra Work')
+
+    def set_calculated_fields(self):
         self.balance_quantity = self.issued_challan_quantity - self.received_quantity
         self.amount = self.received_quantity * self.rate
-        if self.order.status == 'Stitching':
-            self.order.status = 'Extra Work'
-            self.order.save()
-        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.set_calculated_fields()
+        with transaction.atomic():
+            # Orders can get several extra work records, so only the first one advances it
+            advance_order_status(self.order, *self.status_transition)
+            super().save(*args, **kwargs)
     
     class Meta:
         verbose_name_plural = "Extra Work"
@@ -296,18 +386,24 @@ class FinishingAndPacking(models.Model):
     rate = models.DecimalField(max_digits=10, decimal_places=2)
     amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True) # calculated field
 
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 
     def __str__(self):
         return f"Finishing & Packing for Order # {self.order.style_id}"
 
-    def save(self, *args, **kwargs):
+    # Order status moved from and to when a record is added
+    status_transition = ('Extra Work', 'Finishing and Packing')
+
+    def set_calculated_fields(self):
         self.rejected = self.issued_challan_quantity - self.packed_quantity
         self.amount = self.packed_quantity * self.rate
-        if self.order.status == 'Extra Work':
-            self.order.status = 'Finishing and Packing'
-            self.order.save()
-        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.set_calculated_fields()
+        with transaction.atomic():
+            advance_stage_order(self)
+            super().save(*args, **kwargs)
 
     class Meta:
         verbose_name_plural = "Finishing and Packing"
@@ -322,16 +418,199 @@ class Dispatch(models.Model):
     invoice_number = models.CharField(max_length=50)
     box_details = models.TextField(default="")
 
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 
     def __str__(self):
         return f"Dispatch for Order # {self.order.style_id}"
 
+    # Order status moved from and to when a record is added
+    status_transition = ('Finishing and Packing', 'Dispatched')
+
     def save(self, *args, **kwargs):
-        if self.order.status == 'Finishing and Packing':
-            self.order.status = 'Dispatched'
-            self.order.save()
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            advance_stage_order(self)
+            super().save(*args, **kwargs)
     
     class Meta:
-        verbose_name_plural = "Dispatch"
\ No newline at end of file
+        verbose_name_plural = "Dispatch"
+
+class ExportWatermark(models.Model):
+    # Export destination (file path) or consumer name the watermark belongs to
+    consumer = models.CharField(max_length=255, unique=True)
+    exported_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.consumer} exported at {self.exported_at}"
+
+class DailyOrderRollup(models.Model):
+    # Orders per order date and status, kept up to date by Order.save() and the post_delete receiver
+    day = models.DateField()
+    status = models.CharField(max_length=50, choices=Order.STATUS)
+    order_count = models.IntegerField(default=0)
+    quantity = models.BigIntegerField(default=0)
+    amount = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day} - {self.status}: {self.order_count} orders"
+
+    class Meta:
+        unique_together = ('day', 'status')
+
+class CustomerOrderRollup(models.Model):
+    # Orders per customer and status, kept up to date by Order.save() and the post_delete receiver
+    order_received_from = models.CharField(max_length=20)
+    status = models.CharField(max_length=50, choices=Order.STATUS)
+    order_count = models.IntegerField(default=0)
+    quantity = models.BigIntegerField(default=0)
+    amount = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.order_received_from} - {self.status}: {self.order_count} orders"
+
+    class Meta:
+        unique_together = ('order_received_from', 'status')
+
+def _bump_rollup(model, key, order_count, quantity, amount):
+    updated = model.objects.filter(**key).update(
+        order_count=F('order_count') + order_count,
+        quantity=F('quantity') + quantity,
+        amount=F('amount') + amount,
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, order_count=order_count, quantity=quantity, amount=amount)
+    except IntegrityError:
+        # Another writer created the row first
+        _bump_rollup(model, key, order_count, quantity, amount)
+
+def update_order_rollups(old_values, new_values):
+    """
+    Move an order's contribution in the rollup tables from ``old_values`` to
+    ``new_values`` (tuples of ROLLUP_FIELDS, None for a created or deleted order).
+    """
+    update_order_rollups_many([(old_values, new_values)])
+
+def remove_from_rollups(sender, instance, **kwargs):
+    """
+    post_delete receiver taking a deleted order out of the rollup tables. Django
+    sends post_delete for queryset deletes and cascades too, which skip
+    Order.delete().
+    """
+    update_order_rollups(getattr(instance, '_loaded_values', None) or instance._rollup_values(), None)
+    cache.delete(DASHBOARD_CACHE_KEY)
+
+def rebuild_order_rollups(get_model=None, using='default', batch_size=1000):
+    """
+    Recompute the rollup tables from the orders table. ``get_model`` maps a
+    model name to its class, so migrations can pass their historical models.
+    Returns the numbers of daily and customer rollup rows.
+    """
+    get_model = get_model or (lambda name: globals()[name])
+    orders = get_model('Order')._default_manager.using(using)
+    counts = []
+    with transaction.atomic(using=using):
+        for model_name, key, field in (('DailyOrderRollup', 'order_date', 'day'),
+                                       ('CustomerOrderRollup', 'order_received_from', 'order_received_from')):
+            model = get_model(model_name)
+            model._default_manager.using(using).all().delete()
+            rows = (
+                orders.values(key, 'status')
+                .annotate(order_count=Count('id'), total_quantity=Sum('quantity'), total_amount=Sum('amount'))
+                .order_by()
+            )
+            rollups = [
+                model(**{field: row[key]}, status=row['status'], order_count=row['order_count'],
+                      quantity=row['total_quantity'], amount=row['total_amount'])
+                for row in rows
+            ]
+            model._default_manager.using(using).bulk_create(rollups, batch_size=batch_size)
+            counts.append(len(rollups))
+    return tuple(counts)
+
+def update_order_rollups_many(changes):
+    """
+    Apply many ``(old_values, new_values)`` moves at once, with one update per
+    affected rollup row rather than one per order.
+    """
+    daily = defaultdict(lambda: [0, 0, 0])
+    customers = defaultdict(lambda: [0, 0, 0])
+    for old_values, new_values in changes:
+        for values, sign in ((old_values, -1), (new_values, 1)):
+            if values is None:
+                continue
+            order_date, order_received_from, status, quantity, amount = values
+            for counters in (daily[(order_date, status)], customers[(order_received_from, status)]):
+                counters[0] += sign
+                counters[1] += sign * quantity
+                counters[2] += sign * amount
+    for (day, status), counters in daily.items():
+        if any(counters):
+            _bump_rollup(DailyOrderRollup, {'day': day, 'status': status}, *counters)
+    for (order_received_from, status), counters in customers.items():
+        if any(counters):
+            _bump_rollup(CustomerOrderRollup, {'order_received_from': order_received_from, 'status': status}, *counters)
+
+def advance_order_status(order, from_status, to_status):
+    """
+    Move ``order`` from ``from_status`` to ``to_status`` with one UPDATE of its
+    status column that only matches while the order is still in ``from_status``,
+    so two users advancing the same order can't both apply the transition.
+    Returns whether the transition happened.
+    """
+    with transaction.atomic():
+        advanced = Order.objects.filter(id=order.id, status=from_status).update(
+            status=to_status, updated_at=timezone.now()
+        )
+        if advanced:
+            order.status = from_status
+            old_values = order._rollup_values()
+            order.status = to_status
+            update_order_rollups(old_values, order._rollup_values())
+    if advanced:
+        order._loaded_values = order._rollup_values()
+        cache.delete(DASHBOARD_CACHE_KEY)
+        record_status_transition(from_status, to_status)
+    return bool(advanced)
+
+def advance_stage_order(record):
+    """
+    Advance the order of stage ``record``, about to be saved, along the record's
+    status_transition. A new record whose order has left the from status, as
+    when two users add the same stage at once, raises ValidationError so it
+    isn't inserted; saving an existing record again never does.
+    """
+    from_status, to_status = record.status_transition
+    if not advance_order_status(record.order, from_status, to_status) and record._state.adding:
+        raise ValidationError(
+            f'{record._meta.verbose_name_plural.capitalize()} details can only be added to orders with '
+            f'status "{from_status}".'
+        )
+
+def bulk_advance_order_status(order_ids, from_status, to_status):
+    """
+    advance_order_status() for many orders: moves the orders of ``order_ids``
+    that are in ``from_status`` with one UPDATE and returns their ids.
+    """
+    with transaction.atomic():
+        rows = list(
+            Order.objects.select_for_update()
+            .filter(id__in=order_ids, status=from_status)
+            .values_list('id', *ROLLUP_FIELDS)
+        )
+        if not rows:
+            return []
+        advanced_ids = [row[0] for row in rows]
+        Order.objects.filter(id__in=advanced_ids, status=from_status).update(
+            status=to_status, updated_at=timezone.now()
+        )
+        status_index = ROLLUP_FIELDS.index('status')
+        update_order_rollups_many(
+            (values, values[:status_index] + (to_status,) + values[status_index + 1:])
+            for values in (row[1:] for row in rows)
+        )
+    cache.delete(DASHBOARD_CACHE_KEY)
+    record_status_transition(from_status, to_status, len(advanced_ids))
+    return advanced_ids
@@ -0,0 +1,125 @@
+# N+1 query detection: the queries of a request are grouped by fingerprint, and
+# a fingerprint run more than NPLUSONE_THRESHOLD times (typically one query per
+# row of a list) is reported with the view and the line of our code that ran it.
+# On in development (NPLUSONE_DETECT) and under the test runner, which can turn
+# the warnings into errors with --nplusone-raise.
+import os
+import sys
+import warnings
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import middleware, slow_queries
+from .slow_queries import fingerprint, normalize
+
+
+class NPlusOneWarning(UserWarning):
+    pass
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+# Files of the execute wrappers, never where a query came from
+_WRAPPER_FILES = {os.path.abspath(module.__file__) for module in (sys.modules[__name__], middleware, slow_queries)}
+
+
+def _origin(depth=3):
+    """
+    ``path:line in function`` of the innermost ``depth`` frames in the project's
+    own code, innermost first: the line running the query and what called it.
+    """
+    base_dir = os.path.abspath(settings.BASE_DIR)
+    lines = []
+    frame = sys._getframe(1)
+    while frame is not None and len(lines) < depth:
+        path = os.path.abspath(frame.f_code.co_filename)
+        if path.startswith(base_dir + os.sep) and path not in _WRAPPER_FILES and 'site-packages' not in path:
+            lines.append(f'{os.path.relpath(path, base_dir)}:{frame.f_lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return ' <- '.join(lines) or 'unknown'
+
+
+class RepeatedQueryDetector:
+    """Counts the queries run while recording, by fingerprint."""
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold if threshold is not None else settings.NPLUSONE_THRESHOLD
+        self.counts = Counter()
+        self.sql = {}
+        self.origins = {}
+
+    def record_query(self, execute, sql, params, many, context):
+        normalized = normalize(sql)
+        key = fingerprint(normalized)
+        self.counts[key] += 1
+        # Only queries about to be reported pay for walking the stack
+        if self.counts[key] == self.threshold + 1:
+            self.sql[key] = normalized
+            self.origins[key] = _origin()
+        return execute(sql, params, many, context)
+
+    def recording(self):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(self.record_query))
+        return stack
+
+    def repeated(self):
+        """``(fingerprint, count, origin, sql)`` of each query run more than ``threshold`` times."""
+        return [
+            (key, count, self.origins[key], self.sql[key])
+            for key, count in self.counts.most_common() if count > self.threshold
+        ]
+
+    def report(self, where):
+        """Warn about, or with NPLUSONE_RAISE raise, the repeated queries run by ``where``."""
+        repeated = self.repeated()
+        if not repeated:
+            return
+        message = f'{where} ran the same query more than {self.threshold} times:\n' + '\n'.join(
+            f'  {count}x from {origin} [{key}]: {sql[:300]}' for key, count, origin, sql in repeated
+        )
+        if settings.NPLUSONE_RAISE:
+            raise NPlusOneError(message)
+        warnings.warn(message, NPlusOneWarning, stacklevel=2)
+
+
+class NPlusOneMiddleware:
+    """
+    Report queries a request repeats more than NPLUSONE_THRESHOLD times, when
+    NPLUSONE_DETECT is on. Streamed responses are checked once fully sent.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.NPLUSONE_DETECT:
+            return self.get_response(request)
+        detector = RepeatedQueryDetector()
+        with detector.recording():
+            response = self.get_response(request)
+        if getattr(response, 'streaming', False):
+            response.streaming_content = self._iter_checked(request, response.streaming_content, detector)
+        else:
+            detector.report(self._where(request))
+        return response
+
+    def _iter_checked(self, request, content, detector):
+        iterator = iter(content)
+        while True:
+            with detector.recording():
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    break
+            yield chunk
+        detector.report(self._where(request))
+
+    def _where(self, request):
+        match = request.resolver_match
+        return f'{request.method} {request.path} ({match.view_name if match else "unresolved"})'
@@ -0,0 +1,120 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from .metrics import record_cache_lookup
+from .models import Order, FabricPurchased, PrintingAndDyeingSent, PrintingAndDyeingReceived, ClothCutting, Stitching, ExtraWork, FinishingAndPacking, Dispatch
+
+# Template context name of each stage model's record(s) on the order detail page
+STAGE_MODELS = [
+    ('fabric_purchased', FabricPurchased),
+    ('printing_dyeing_sent', PrintingAndDyeingSent),
+    ('printing_dyeing_received', PrintingAndDyeingReceived),
+    ('cloth_cutting', ClothCutting),
+    ('stitching', Stitching),
+    ('extra_works', ExtraWork),
+    ('finishing_packing', FinishingAndPacking),
+    ('dispatch', Dispatch),
+]
+
+STATUS_POSITIONS = {status: position for position, (status, _) in enumerate(Order.STATUS, start=1)}
+
+
+def _stage_columns(model):
+    accessor = model._meta.model_name
+    fields = [field.attname for field in model._meta.concrete_fields]
+    return accessor, fields, [f'{accessor}__{field}' for field in fields] + [f'{accessor}__user__username']
+
+
+def load_stage_records(order):
+    """
+    Load every stage record of ``order`` in one query, joining all stage tables
+    (and the users who added them) onto the order row. Returns the order detail
+    template's context, with ``extra_works`` as a list and every other stage as
+    its first record or None.
+    """
+    columns = [_stage_columns(model) for _, model in STAGE_MODELS]
+    lookups = [lookup for _, _, stage_lookups in columns for lookup in stage_lookups]
+    rows = Order.objects.filter(id=order.id).values_list(*lookups)
+
+    # The joins yield one row per extra work; the other stages repeat on every row
+    records = {name: {} for name, _ in STAGE_MODELS}
+    for row in rows:
+        offset = 0
+        for (name, model), (accessor, fields, stage_lookups) in zip(STAGE_MODELS, columns):
+            values = row[offset:offset + len(fields)]
+            username = row[offset + len(fields)]
+            offset += len(stage_lookups)
+            pk = values[0]
+            if pk is None or pk in records[name]:
+                continue
+            instance = model.from_db(None, fields, values)
+            instance.order = order
+            if instance.user_id is not None:
+                instance.user = User.from_db(None, ['id', 'username'], [instance.user_id, username])
+            records[name][pk] = instance
+
+    context = {}
+    for name, model in STAGE_MODELS:
+        instances = [records[name][pk] for pk in sorted(records[name])]
+        context[name] = instances if model is ExtraWork else next(iter(instances), None)
+
+    dispatch = context['dispatch']
+    if dispatch:
+        dispatch.box_details = [item for item in dispatch.box_details.replace("\r", "\n").split("\n") if item.strip() != ""]
+    return context
+
+
+def _version_key(order_id):
+    return f'order_detail_version:{order_id}'
+
+
+def get_order_version(order_id):
+    """
+    Current version of an order's cached detail sections. A missing version
+    (never set, bumped or evicted) is replaced by a new random one, so stale
+    fragments are never read back.
+    """
+    version = cache.get(_version_key(order_id))
+    if version is None:
+        cache.add(_version_key(order_id), uuid4().hex, None)
+        version = cache.get(_version_key(order_id))
+    return version
+
+
+def bump_order_version(order_id):
+    cache.delete(_version_key(order_id))
+
+
+def bump_order_versions(order_ids):
+    cache.delete_many([_version_key(order_id) for order_id in order_ids])
+
+
+def render_stage_sections(order, status_position):
+    """
+    Return the rendered stage sections of the order detail page, from the cache
+    when this version of the order has been rendered before.
+    """
+    key = f'order_detail:{order.id}:{get_order_version(order.id)}'
+    sections = cache.get(key)
+    record_cache_lookup('order_detail', sections is not None)
+    if sections is None:
+        context = load_stage_records(order)
+        context['order'] = order
+        context['status_position'] = status_position
+        sections = render_to_string('order_stages.html', context)
+        cache.set(key, sections, settings.ORDER_DETAIL_CACHE_TIMEOUT)
+    return sections
+
+
+def bump_on_change(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    order_id = instance.pk if sender is Order else instance.order_id
+    # After commit, so a concurrent request can't cache the sections as they
+    # were before this change under the new version
+    transaction.on_commit(lambda: bump_order_version(order_id), using=using)
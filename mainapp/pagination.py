@@ -0,0 +1,105 @@
+from datetime import date
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db.models import Q
+
+
+def _encode_cursor(order):
+    return f"{order.order_date.isoformat()}_{order.id}"
+
+
+def _decode_cursor(cursor):
+    """Return (order_date, id) for a cursor string, or None if it is malformed."""
+    try:
+        order_date, order_id = cursor.split('_')
+        return date.fromisoformat(order_date), int(order_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+class OrderPage:
+    """
+    One page of orders together with the query strings that lead to the
+    neighbouring pages (empty when there is no such page).
+    """
+    def __init__(self, orders, next_query='', previous_query=''):
+        self.orders = orders
+        self.next_query = next_query
+        self.previous_query = previous_query
+        self.has_next = bool(next_query)
+        self.has_previous = bool(previous_query)
+
+    def __iter__(self):
+        return iter(self.orders)
+
+    def __len__(self):
+        return len(self.orders)
+
+
+def _cursor_queries(orders, params, has_next, has_previous):
+    if not orders:
+        return '', ''
+    next_query = urlencode({**params, 'after': _encode_cursor(orders[-1])}) if has_next else ''
+    previous_query = urlencode({**params, 'before': _encode_cursor(orders[0])}) if has_previous else ''
+    return next_query, previous_query
+
+
+def keyset_paginate(request, orders, params=None, page_size=None):
+    """
+    Return an OrderPage from the orders queryset using the ``after``/``before``
+    cursors in the request's query string. Pages are selected with a range
+    condition on (order_date, id) rather than an OFFSET, so every page costs the
+    same no matter how deep into the history it is.
+
+    ``params`` are extra query parameters (e.g. the search string) kept in the
+    links to the neighbouring pages.
+    """
+    page_size = page_size or settings.ORDER_PAGE_SIZE
+    params = params or {}
+    after = _decode_cursor(request.GET.get('after'))
+    before = _decode_cursor(request.GET.get('before'))
+
+    if before:
+        order_date, order_id = before
+        rows = list(
+            orders.filter(Q(order_date__gt=order_date) | Q(order_date=order_date, id__gt=order_id))
+            .order_by('order_date', 'id')[:page_size + 1]
+        )
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        return OrderPage(rows, *_cursor_queries(rows, params, has_next=True, has_previous=has_previous))
+
+    if after:
+        order_date, order_id = after
+        orders = orders.filter(Q(order_date__lt=order_date) | Q(order_date=order_date, id__lt=order_id))
+    rows = list(orders.order_by('-order_date', '-id')[:page_size + 1])
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    return OrderPage(rows, *_cursor_queries(rows, params, has_next=has_next, has_previous=bool(after)))
+
+
+def ranked_paginate(request, search, params=None, page_size=None):
+    """
+    Return an OrderPage of ranked search results. ``search(limit, offset)``
+    returns order ids best match first; ranked results have no stable sort key
+    to build a cursor from, so they are paged with the ``page`` number instead.
+    """
+    from .models import Order
+
+    page_size = page_size or settings.ORDER_PAGE_SIZE
+    params = params or {}
+    try:
+        page_number = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page_number = 1
+
+    order_ids = search(page_size + 1, (page_number - 1) * page_size)
+    has_next = len(order_ids) > page_size
+    order_ids = order_ids[:page_size]
+    orders_by_id = Order.objects.in_bulk(order_ids)
+    rows = [orders_by_id[order_id] for order_id in order_ids if order_id in orders_by_id]
+
+    next_query = urlencode({**params, 'page': page_number + 1}) if has_next else ''
+    previous_query = urlencode({**params, 'page': page_number - 1}) if page_number > 1 else ''
+    return OrderPage(rows, next_query, previous_query)
@@ -0,0 +1,27 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connections
+
+
+def _init_worker():
+    # Where workers are spawned (macOS, Windows) they start without Django set
+    # up; forked ones start with copies of the parent's connection objects,
+    # which they must never use
+    django.setup()
+    connections.close_all()
+
+
+def worker_processes(max_workers):
+    """
+    A ProcessPoolExecutor for work that queries the database, whose workers
+    open connections of their own.
+    """
+    # Forked workers must not inherit open connections, nor the sockets kept
+    # open by a psycopg connection pool, which close_all() only returns
+    # connections to
+    for connection in connections.all():
+        connection.close()
+        if connection.settings_dict['OPTIONS'].get('pool'):
+            connection.close_pool()
+    return ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker)
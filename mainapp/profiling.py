@@ -0,0 +1,90 @@
+# A sampling profiler for slow requests and management commands, writing the
+# sampled stacks in the folded format read by flamegraph.pl, speedscope and
+# most other flame graph tools: one "outer;inner;innermost count" line per stack.
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.utils import timezone
+
+
+class SamplingProfiler:
+    """
+    Records the call stack of the thread that starts it every ``interval``
+    seconds, from a background thread, until stopped. Usable as a context manager.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval if interval is not None else settings.PROFILE_INTERVAL_MS / 1000
+        self.stacks = Counter()
+        self._thread_id = None
+        self._stopped = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(target=self._sample, name='profiler', daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._sampler.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f'{frame.f_globals.get("__name__", "?")}.{frame.f_code.co_qualname}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+
+def profile_path(name):
+    """A new file path under MEDIA_ROOT/profiles for a profile of ``name``."""
+    return os.path.join(
+        settings.MEDIA_ROOT, 'profiles', f'{name}_{timezone.now().strftime("%Y%m%d_%H%M%S_%f")}.folded'
+    )
+
+
+class ProfiledCommandMixin:
+    """
+    Adds a --profile option to a management command, which runs the command
+    under a SamplingProfiler. Only the command's own process is sampled, not
+    the worker processes it starts.
+    """
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument('--profile', action='store_true',
+                            help='Sample the command\'s call stacks and write them as a flame graph file '
+                                 'under MEDIA_ROOT/profiles')
+        return parser
+
+    def execute(self, *args, **options):
+        if not options.get('profile'):
+            return super().execute(*args, **options)
+        started = time.perf_counter()
+        with SamplingProfiler() as profiler:
+            result = super().execute(*args, **options)
+        path = profile_path(self.__module__.rsplit('.', 1)[-1])
+        profiler.save(path)
+        self.stderr.write(f'Profile of {time.perf_counter() - started:.1f}s written to {path}')
+        return result
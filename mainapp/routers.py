@@ -0,0 +1,105 @@
+# Sends the queries of read-only views to a replica database. Reads are only
+# routed to the replica inside replica_reads() (entered by the read_only view
+# decorator), and never for a user who saved something in the last
+# REPLICA_PIN_SECONDS, so people always see their own changes.
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+REPLICA_ALIAS = 'replica'
+
+# Cookie set on responses to requests that wrote to the database
+PIN_COOKIE = 'kms_primary'
+
+_read_alias = ContextVar('read_alias', default=None)
+_wrote = ContextVar('wrote', default=None)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in connections.settings
+
+
+@contextmanager
+def replica_reads():
+    """Route the reads made in this block to the replica, if one is configured."""
+    token = _read_alias.set(REPLICA_ALIAS if replica_configured() else None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def _iter_on_replica(content):
+    # Streamed content is produced after the view returned, so every chunk is
+    # read inside its own replica_reads() block
+    iterator = iter(content)
+    while True:
+        with replica_reads():
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+        yield chunk
+
+
+def read_only(view):
+    """Mark a view that only reads, so its queries may go to the replica."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        # Load the session and user from the primary first; a replica that
+        # hasn't caught up with a fresh login would look like a logged out user
+        if hasattr(request, 'user'):
+            request.user.is_authenticated
+        if request.COOKIES.get(PIN_COOKIE):
+            return view(request, *args, **kwargs)
+        with replica_reads():
+            response = view(request, *args, **kwargs)
+        if getattr(response, 'streaming', False):
+            response.streaming_content = _iter_on_replica(response.streaming_content)
+        return response
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary, never migrated on its own
+        return db != REPLICA_ALIAS
+
+
+def note_write(sender, **kwargs):
+    wrote = _wrote.get()
+    if wrote is not None:
+        wrote[0] = True
+
+
+class PinPrimaryAfterWriteMiddleware:
+    """
+    Keep a user's reads on the primary for REPLICA_PIN_SECONDS after a request
+    of theirs saved or deleted something, until the replica has caught up.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        wrote = [False]
+        token = _wrote.set(wrote)
+        try:
+            response = self.get_response(request)
+        finally:
+            _wrote.reset(token)
+        if wrote[0] and replica_configured():
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
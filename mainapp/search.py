@@ -0,0 +1,162 @@
+# Full-text search over orders and their stage records, backed by an SQLite FTS5
+# table. Every order and every stage record is one row of the index; a search
+# returns the orders with the best ranked matching rows.
+from django.apps import apps
+from django.db import connection, connections
+from django.db.models import Q
+
+SEARCH_TABLE = 'mainapp_order_search'
+
+# Text fields indexed for each model, keyed by model name. The position in this
+# dict is part of the FTS rowid, so only append to it.
+SEARCH_FIELDS = {
+    'Order': ['style_id', 'po_number', 'order_received_from'],
+    'FabricPurchased': ['purchased_from', 'invoice_number', 'fabric_detail', 'fabric_dyer'],
+    'PrintingAndDyeingSent': ['dyer_printer_name', 'fabric_detail'],
+    'PrintingAndDyeingReceived': ['received_challan_number'],
+    'ClothCutting': ['issued_challan_number', 'job_worker_name', 'fabric_detail', 'received_challan_number'],
+    'Stitching': ['issued_challan_number', 'job_worker_name'],
+    'ExtraWork': ['issued_challan_number', 'job_worker_name', 'extra_work_name'],
+    'FinishingAndPacking': ['issued_challan_number', 'job_worker_name'],
+    'Dispatch': ['dispatched_to', 'delivery_note', 'invoice_number'],
+}
+SOURCES = list(SEARCH_FIELDS)
+
+# Rowids are pk * ROWID_STRIDE + source, so a record can be replaced by rowid
+ROWID_STRIDE = 16
+
+# Orders returned by a search are capped so ranking stays cheap on broad terms
+SEARCH_RESULT_LIMIT = 500
+
+
+def is_supported(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+
+def create_search_table(cursor):
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(order_id UNINDEXED, body)"
+    )
+
+
+def _rowid(source, pk):
+    return pk * ROWID_STRIDE + SOURCES.index(source)
+
+
+def _document(source, instance):
+    values = [getattr(instance, field) for field in SEARCH_FIELDS[source]]
+    return ' '.join(str(value) for value in values if value)
+
+
+def _order_id(source, instance):
+    return instance.pk if source == 'Order' else instance.order_id
+
+
+def index_record(instance, using='default'):
+    """Add or replace the index row of an order or stage record."""
+    source = type(instance).__name__
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [_rowid(source, instance.pk)]
+        )
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, order_id, body) VALUES (%s, %s, %s)",
+            [_rowid(source, instance.pk), _order_id(source, instance), _document(source, instance)],
+        )
+
+
+def index_records(instances, using='default'):
+    """Index many new records of one model, e.g. after a bulk_create()."""
+    instances = list(instances)
+    if not instances or not is_supported(using):
+        return
+    source = type(instances[0]).__name__
+    rows = [(_rowid(source, instance.pk), _order_id(source, instance), _document(source, instance)) for instance in instances]
+    with connections[using].cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany(f"INSERT INTO {SEARCH_TABLE} (rowid, order_id, body) VALUES (%s, %s, %s)", rows)
+
+
+def unindex_record(instance, using='default'):
+    source = type(instance).__name__
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [_rowid(source, instance.pk)])
+
+
+def rebuild_search_index(get_model, using='default', batch_size=2000):
+    """
+    Repopulate the index from scratch. ``get_model`` maps a model name to its
+    class, so migrations can pass their historical models. Returns the number of
+    indexed rows.
+    """
+    indexed = 0
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        for source, fields in SEARCH_FIELDS.items():
+            model = get_model(source)
+            order_field = 'pk' if source == 'Order' else 'order_id'
+            rows = model._default_manager.using(using).values_list('pk', order_field, *fields)
+            batch = []
+            for pk, order_id, *values in rows.iterator(chunk_size=batch_size):
+                body = ' '.join(str(value) for value in values if value)
+                batch.append((_rowid(source, pk), order_id, body))
+                if len(batch) >= batch_size:
+                    cursor.executemany(f"INSERT INTO {SEARCH_TABLE} (rowid, order_id, body) VALUES (%s, %s, %s)", batch)
+                    indexed += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(f"INSERT INTO {SEARCH_TABLE} (rowid, order_id, body) VALUES (%s, %s, %s)", batch)
+                indexed += len(batch)
+    return indexed
+
+
+def _match_expression(text):
+    # Every word has to match, as a prefix; quoting keeps FTS5 operators and
+    # punctuation in user input from being parsed as query syntax
+    terms = [term.replace('"', '""') for term in text.split()]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_order_ids(text, limit=SEARCH_RESULT_LIMIT, offset=0):
+    """Ids of the orders matching ``text``, best match first."""
+    expression = _match_expression(text)
+    if not expression:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT order_id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+            f"GROUP BY order_id ORDER BY MIN(rank) LIMIT %s OFFSET %s",
+            [expression, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def fallback_filter(text):
+    """
+    Order filter for databases without FTS5, matching the same fields as the
+    index: every word has to appear in the order or in one of its stage records.
+    """
+    condition = Q()
+    for term in text.split():
+        term_condition = Q()
+        for source, fields in SEARCH_FIELDS.items():
+            matches = Q()
+            for field in fields:
+                matches |= Q(**{f'{field}__icontains': term})
+            if source == 'Order':
+                term_condition |= matches
+            else:
+                model = apps.get_model('mainapp', source)
+                term_condition |= Q(id__in=model.objects.filter(matches).values('order_id'))
+        condition &= term_condition
+    return condition
+
+
+def index_on_save(sender, instance, raw=False, using='default', **kwargs):
+    if not raw and is_supported(using):
+        index_record(instance, using)
+
+
+def unindex_on_delete(sender, instance, using='default', **kwargs):
+    if is_supported(using):
+        unindex_record(instance, using)
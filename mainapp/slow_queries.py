@@ -0,0 +1,103 @@
+# Slow query log: every query taking SLOW_QUERY_MS or longer is logged to the
+# mainapp.slow_queries logger as a JSON line with its fingerprint (the SQL with
+# its values taken out, so the same query with other values groups together),
+# the URL name of the request that made it and the database's plan for it.
+# The slow_query_report command sums the log up per fingerprint.
+import hashlib
+import json
+import logging
+import re
+import time
+
+from django.conf import settings
+
+from .middleware import current_url_name
+
+logger = logging.getLogger('mainapp.slow_queries')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+# Savepoints are named after the thread and a counter, so every one would get
+# a fingerprint of its own
+_SAVEPOINT = re.compile(r'\b(SAVEPOINT\s+)(?:"[^"]*"|\w+)', re.IGNORECASE)
+_VALUE_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """
+    ``sql`` with its values and savepoint names replaced by ? and IN lists of
+    any length by IN (...).
+    """
+    sql = _SAVEPOINT.sub(r'\1?', sql)
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _VALUE_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()[:12]
+
+
+def explain(connection, sql, params):
+    """The database's plan for ``sql``, one line per step, or None if it can't be had."""
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    # A failed statement aborts a PostgreSQL transaction, so inside one the
+    # EXPLAIN runs in a savepoint rolled back if it fails
+    savepoint = connection.vendor != 'sqlite' and connection.in_atomic_block
+    # A bare cursor of the backend: not logged, not counted and not passed
+    # through the execute wrappers again
+    cursor = connection.create_cursor()
+    try:
+        if savepoint:
+            cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            cursor.execute(prefix + sql, params)
+            return [str(row[-1]) for row in cursor.fetchall()]
+        except Exception:
+            if savepoint:
+                cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            return None
+        finally:
+            if savepoint:
+                cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+    except Exception:
+        # Setting up or releasing the savepoint failed
+        return None
+    finally:
+        cursor.close()
+
+
+def log_slow_queries(execute, sql, params, many, context):
+    """Execute wrapper logging the queries that take SLOW_QUERY_MS or longer."""
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration_ms = (time.perf_counter() - started) * 1000
+    if duration_ms >= settings.SLOW_QUERY_MS:
+        connection = context['connection']
+        normalized = normalize(sql)
+        # Only reads are explained; a plan of a whole executemany() batch means little
+        plan = None
+        if not many and normalized.upper().startswith('SELECT'):
+            plan = explain(connection, sql, params)
+        logger.warning(json.dumps({
+            'event': 'slow_query',
+            'fingerprint': fingerprint(normalized),
+            'sql': normalized,
+            'duration_ms': round(duration_ms, 1),
+            'url_name': current_url_name(),
+            'alias': connection.alias,
+            'plan': plan,
+        }))
+    return result
+
+
+def watch_connection(sender, connection, **kwargs):
+    """connection_created receiver adding log_slow_queries to every connection."""
+    if log_slow_queries not in connection.execute_wrappers:
+        # First, as execute_wrapper() blocks active right now remove the last
+        # wrapper when they end
+        connection.execute_wrappers.insert(0, log_slow_queries)
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class NPlusOneTestRunner(DiscoverRunner):
+    """
+    The test runner with N+1 query detection on (see mainapp.nplusone), so a
+    test requesting a view that repeats a query warns, or with
+    --nplusone-raise fails.
+    """
+
+    def __init__(self, nplusone_raise=False, **kwargs):
+        super().__init__(**kwargs)
+        self.nplusone_raise = nplusone_raise
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--nplusone-raise', action='store_true',
+                            help='Fail requests that run the same query more than NPLUSONE_THRESHOLD times.')
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.NPLUSONE_DETECT = True
+        settings.NPLUSONE_RAISE = settings.NPLUSONE_RAISE or self.nplusone_raise
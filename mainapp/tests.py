@@ -1,3 +1,404 @@
+import json
+import os
+import re
+import tempfile
+import unittest
+from django.conf import settings
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve, reverse
+from prometheus_client import REGISTRY
+
+from . import urls
+from .nplusone import NPlusOneError, NPlusOneWarning, RepeatedQueryDetector
+from .slow_queries import fingerprint, normalize
+from .models import Order, FabricPurchased, PrintingAndDyeingSent, PrintingAndDyeingReceived, ClothCutting, Stitching, ExtraWork, FinishingAndPacking, Dispatch, DailyOrderRollup, CustomerOrderRollup, advance_order_status, rebuild_order_rollups
+
+
+def seed_orders(count, user=None):
+    """
+    Create ``count`` orders spread evenly over every stage of the order lifecycle,
+    going through the models' save() so statuses and rollups are kept up to date.
+    """
+    orders = []
+    for i in range(count):
+        order = Order.objects.create(
+            po_number=f'PO-{i}', style_id=f'STY-{i}', order_received_from=f'Customer {i % 7}',
+            quantity_m=10 + i % 5, quantity_l=5, rate=100, user=user,
+        )
+        stage = i % 9
+        if stage >= 1:
+            FabricPurchased.objects.create(
+                order=order, purchased_from=f'Mill {i % 4}', quantity=30, rate=50, invoice_number=f'INV-{i}',
+                fabric_detail=f'Fabric {i % 3}', fabric_length='44"', fabric_dyer=f'Dyer {i % 3}', user=user,
+            )
+        if stage >= 2:
+            sent = PrintingAndDyeingSent.objects.create(
+                order=order, dyer_printer_name=f'Dyer {i % 3}', fabric_detail=f'Fabric {i % 3}',
+                fabric_length='44"', issued_challan_quantity=30, user=user,
+            )
+        if stage >= 3:
+            PrintingAndDyeingReceived.objects.create(
+                order=order, printing_and_dyeing_sent=sent, shrinkage_in_percentage=5,
+                received_challan_number=f'RCV-{i}', rate=10, user=user,
+            )
+        if stage >= 4:
+            ClothCutting.objects.create(
+                order=order, issued_challan_number=f'CUT-{i}', job_worker_name=f'Cutter {i % 2}',
+                fabric_detail=f'Fabric {i % 3}', fabric_length='44"', issued_challan_quantity=28,
+                received_quantity=27, received_challan_number=f'CUTR-{i}', rate=5, user=user,
+            )
+        if stage >= 5:
+            Stitching.objects.create(
+                order=order, issued_challan_number=f'STI-{i}', job_worker_name=f'Tailor {i % 2}',
+                issued_challan_quantity=27, received_quantity=26, rate=20, user=user,
+            )
+        if stage >= 6:
+            for n in range(1 + i % 2):
+                ExtraWork.objects.create(
+                    order=order, issued_challan_number=f'EXT-{i}-{n}', job_worker_name=f'Worker {n}',
+                    extra_work_name='Embroidery', issued_challan_quantity=26, received_quantity=26, rate=8, user=user,
+                )
+        if stage >= 7:
+            FinishingAndPacking.objects.create(
+                order=order, issued_challan_number=f'FIN-{i}', job_worker_name='Packer',
+                issued_challan_quantity=26, packed_quantity=25, rate=3, user=user,
+            )
+        if stage >= 8:
+            Dispatch.objects.create(
+                order=order, dispatched_to=f'Customer {i % 7}', quantity=25, invoice_number=f'DIS-{i}',
+                box_details='Box 1: M - 15\nBox 2: L - 10', user=user,
+            )
+        orders.append(order)
+    return orders
+
+
+def view_requests(order):
+    """(method, url, data) for every mainapp URL, logout last."""
+    return [
+        ('get', reverse('index'), None),
+        ('get', reverse('index2'), None),
+        ('get', reverse('login'), None),
+        ('get', reverse('orderdetail', args=[order.id]), None),
+        ('get', reverse('addorder'), None),
+        ('get', reverse('addfabricpurchased', args=[order.id]), None),
+        ('get', reverse('addprintinganddyeingsent', args=[order.id]), None),
+        ('get', reverse('addprintinganddyeingreceived', args=[order.id]), None),
+        ('get', reverse('addclothcutting', args=[order.id]), None),
+        ('get', reverse('addstitching', args=[order.id]), None),
+        ('get', reverse('addextrawork', args=[order.id]), None),
+        ('get', reverse('addfinishingandpacking', args=[order.id]), None),
+        ('get', reverse('adddispatch', args=[order.id]), None),
+        ('get', reverse('import_orders'), None),
+        ('get', reverse('filter_by_status', args=['all']), None),
+        ('get', reverse('filter_by_status', args=['stitching']), None),
+        ('post', reverse('search_orders'), {'search_string': 'Customer 1'}),
+        ('get', reverse('search_orders') + '?search_on=dyer_printer_name&search=Dyer 1', None),
+        ('get', reverse('search_orders') + '?search_on=fabric_detail&search=Fabric 1', None),
+        ('get', reverse('track_dyers'), None),
+        ('get', reverse('track_fabrics'), None),
+        ('post', reverse('export_orders_csv', args=['m']), None),
+        ('post', reverse('export_orders_csv', args=['y']), None),
+        ('post', reverse('export_orders_csv', args=['d']), None),
+        ('get', reverse('autocomplete', args=['order_received_from']) + '?q=Cust', None),
+        ('get', reverse('metrics'), None),
+        ('post', reverse('logout'), None),
+    ]
+
+
+def fetch(client, method, url, data=None):
+    """Make a request, consuming streamed responses so all of their queries run."""
+    response = getattr(client, method)(url, data or {})
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class QueryPlanTests(TestCase):
+    # Tables whose size is bounded by the calendar rather than the order history,
+    # so reading them whole is intended
+    SCAN_ALLOWED = {'mainapp_dailyorderrollup', 'mainapp_customerorderrollup'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner', password='planner', is_staff=True)
+        cls.orders = seed_orders(30, cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _full_scans(self, sql):
+        tables = set(connection.introspection.table_names())
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = [row[-1] for row in cursor.fetchall()]
+        scans = []
+        for detail in plan:
+            # "SCAN <table>" without "USING ... INDEX" reads every row of the table
+            match = re.match(r'SCAN (\w+)(?: AS \w+)?$', detail)
+            if match and match.group(1) in tables and match.group(1) not in self.SCAN_ALLOWED:
+                scans.append(detail)
+        return scans
+
+    def test_views_do_not_scan_whole_tables(self):
+        for method, url, data in view_requests(self.orders[4]):
+            # Autocomplete reads its values whole, once per AUTOCOMPLETE_MAX_AGE,
+            # and the metrics count the outstanding challans once per GAUGE_CACHE_TIMEOUT
+            if resolve(url.split('?')[0]).url_name in ('autocomplete', 'metrics'):
+                continue
+            with CaptureQueriesContext(connection) as context:
+                fetch(self.client, method, url, data)
+            for query in context.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                with self.subTest(view=f'{method.upper()} {url}', sql=query['sql'][:200]):
+                    self.assertEqual(self._full_scans(query['sql']), [])
+
+
+
+# Requests over 1000 orders, with empty caches, can take longer than the slow
+# request and query thresholds; logging each of them would bury the test output
+@override_settings(SLOW_REQUEST_MS=60_000, SLOW_QUERY_MS=60_000)
+class QueryBudgetTests(TestCase):
+    """
+    Every URL has to stay within a fixed number of queries, whatever the number
+    of orders; a view whose query count grows with the data fails at 1000 orders.
+    Budgets are the most queries any of the order's stages needs, with empty caches.
+    """
+    ORDER_COUNT = 10
+
+    BUDGETS = {
+        ('get', 'index'): 5,
+        ('get', 'index2'): 7,
+        ('get', 'login'): 2,
+        ('get', 'orderdetail'): 4,
+        ('get', 'addorder'): 2,
+        ('get', 'addfabricpurchased'): 6,
+        ('get', 'addprintinganddyeingsent'): 6,
+        ('get', 'addprintinganddyeingreceived'): 7,
+        ('get', 'addclothcutting'): 6,
+        ('get', 'addstitching'): 6,
+        ('get', 'addextrawork'): 6,
+        ('get', 'addfinishingandpacking'): 6,
+        ('get', 'adddispatch'): 6,
+        ('get', 'import_orders'): 5,
+        ('get', 'filter_by_status'): 3,
+        ('post', 'search_orders'): 4,
+        ('get', 'search_orders'): 3,
+        ('get', 'track_dyers'): 3,
+        ('get', 'track_fabrics'): 3,
+        # The 'd' export also reads and moves its watermark
+        ('post', 'export_orders_csv'): 19,
+        ('get', 'autocomplete'): 4,
+        # The gauges of orders per status and outstanding challans per stage
+        ('get', 'metrics'): 5,
+        ('post', 'logout'): 4,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('budget', password='budget', is_staff=True)
+        orders = seed_orders(cls.ORDER_COUNT, cls.user)
+        # One order at every stage, so each view is measured on all its paths
+        cls.stage_orders = orders[:9]
+
+    def test_every_url_has_a_budget(self):
+        requested = {resolve(url.split('?')[0]).url_name for _, url, _ in view_requests(self.stage_orders[0])}
+        budgeted = {name for _, name in self.BUDGETS}
+        for pattern in urls.urlpatterns:
+            with self.subTest(url=pattern.name):
+                self.assertIn(pattern.name, requested)
+                self.assertIn(pattern.name, budgeted)
+
+    def test_views_stay_within_query_budget(self):
+        for order in self.stage_orders:
+            self.client.force_login(self.user)
+            for method, url, data in view_requests(order):
+                cache.clear()
+                with CaptureQueriesContext(connection) as context:
+                    fetch(self.client, method, url, data)
+                key = (method, resolve(url.split('?')[0]).url_name)
+                with self.subTest(view=f'{method.upper()} {url}', status=order.status):
+                    self.assertLessEqual(len(context.captured_queries), self.BUDGETS[key])
+
+
+class LargeQueryBudgetTests(QueryBudgetTests):
+    ORDER_COUNT = 1000
+
+
+class ServerTimingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('timer', password='timer', is_staff=True)
+        cls.orders = seed_orders(9, cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_header_reports_queries(self):
+        url = reverse('orderdetail', args=[self.orders[8].id])
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        header = response['Server-Timing']
+        self.assertIn(f'desc="{len(context.captured_queries)} queries"', header)
+        for metric in ('sql;dur=', 'view;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(metric, header)
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_with_url_name(self):
+        with self.assertLogs('mainapp.performance', 'WARNING') as logs:
+            fetch(self.client, 'post', reverse('export_orders_csv', args=['m']))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['url_name'], 'export_orders_csv')
+        self.assertGreater(record['queries'], 0)
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('scraper', password='scraper', is_staff=True)
+        cls.orders = seed_orders(9, cls.user)
+
+    def test_scrape_reports_requests_transitions_and_gauges(self):
+        labels = {'from_status': 'Pending', 'to_status': 'Fabric Purchased'}
+        before = REGISTRY.get_sample_value('kms_order_status_transitions_total', labels)
+        self.assertTrue(advance_order_status(self.orders[0], 'Pending', 'Fabric Purchased'))
+        self.assertEqual(REGISTRY.get_sample_value('kms_order_status_transitions_total', labels), before + 1)
+
+        cache.clear()
+        self.client.get(reverse('login'))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('kms_request_duration_seconds_count{method="GET",url_name="login"}', body)
+        self.assertIn('kms_outstanding_challans{stage="printing_and_dyeing"}', body)
+        self.assertIn('kms_orders{status="Fabric Purchased"} 2.0', body)
+
+    def test_other_addresses_need_the_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.5').status_code, 403)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.5', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.5', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+
+class ProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('profiler', password='profiler', is_staff=True)
+        cls.clerk = User.objects.create_user('clerk', password='clerk')
+        cls.orders = seed_orders(9, cls.staff)
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name, PROFILE_REQUESTS_PER_HOUR=1))
+        cache.clear()
+
+    def test_staff_requests_are_profiled_within_the_rate_limit(self):
+        self.client.force_login(self.staff)
+        url = reverse('orderdetail', args=[self.orders[8].id])
+        response = self.client.get(url, {'profile': '1'})
+        self.assertTrue(os.path.isfile(os.path.join(settings.MEDIA_ROOT, response['X-Profile'])))
+        self.assertEqual(self.client.get(url, HTTP_X_PROFILE='1')['X-Profile'], 'rate limited')
+
+    def test_other_users_are_not_profiled(self):
+        self.client.force_login(self.clerk)
+        response = self.client.get(reverse('orderdetail', args=[self.orders[8].id]), {'profile': '1'})
+        self.assertNotIn('X-Profile', response)
+
+
+class SlowQueryLogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('slowpoke', password='slowpoke', is_staff=True)
+        cls.orders = seed_orders(9, cls.user)
+
+    def test_fingerprint_ignores_values(self):
+        first = normalize("SELECT * FROM t WHERE a = 'x' AND b IN (%s, %s, %s) LIMIT 21")
+        second = normalize("SELECT *  FROM t WHERE a = 'y''s' AND b IN (%s) LIMIT 5")
+        self.assertEqual(first, 'SELECT * FROM t WHERE a = ? AND b IN (...) LIMIT ?')
+        self.assertEqual(fingerprint(first), fingerprint(second))
+        self.assertEqual(normalize('RELEASE SAVEPOINT "s1397910586_x10785"'), 'RELEASE SAVEPOINT ?')
+
+    def test_slow_queries_are_logged_with_url_name_and_plan(self):
+        self.client.force_login(self.user)
+        with override_settings(SLOW_QUERY_MS=0), self.assertLogs('mainapp.slow_queries', 'WARNING') as logs:
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(reverse('track_fabrics'))
+        entries = [json.loads(record.getMessage()) for record in logs.records]
+        # Getting the plans runs no queries of its own
+        self.assertEqual(len(entries), len(context.captured_queries))
+        entry = next(entry for entry in entries if 'mainapp_printinganddyeingsent' in entry['sql'])
+        self.assertEqual(entry['url_name'], 'track_fabrics')
+        self.assertTrue(entry['plan'])
+
+
+class NPlusOneTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('looper', password='looper', is_staff=True)
+        cls.orders = seed_orders(9, cls.user)
+
+    @override_settings(NPLUSONE_RAISE=False)
+    def test_repeated_queries_are_reported_with_their_line(self):
+        detector = RepeatedQueryDetector(threshold=3)
+        with detector.recording():
+            # Each record's __str__ loads its order
+            names = [str(record) for record in FabricPurchased.objects.all()]
+        [(_, count, origin, sql)] = detector.repeated()
+        self.assertEqual(count, len(names))
+        self.assertRegex(origin, r'^mainapp/models.py:\d+ in __str__ <- mainapp/tests.py:\d+')
+        self.assertIn('FROM "mainapp_order"', sql)
+        with self.assertWarns(NPlusOneWarning):
+            detector.report('the loop')
+
+    @override_settings(NPLUSONE_THRESHOLD=0, NPLUSONE_RAISE=True)
+    def test_middleware_raises_naming_the_view(self):
+        self.client.force_login(self.user)
+        with self.assertRaisesMessage(NPlusOneError, '(track_dyers)'):
+            self.client.get(reverse('track_dyers'))
+
+
+
+class StageTransitionTests(TestCase):
+    def test_a_stage_is_added_once_per_order(self):
+        order = Order.objects.create(po_number='PO-1', style_id='STY-1', order_received_from='Customer', quantity_m=10, rate=100)
+        # Both users loaded the order while it was still Pending
+        first, second = (
+            FabricPurchased(
+                order=Order.objects.get(id=order.id), purchased_from='Mill', quantity=30, rate=50,
+                invoice_number=f'INV-{n}', fabric_detail='Cotton', fabric_length='44"', fabric_dyer='Dyer',
+            )
+            for n in range(2)
+        )
+        first.save()
+        with self.assertRaises(ValidationError):
+            second.save()
+        self.assertEqual(FabricPurchased.objects.filter(order=order).count(), 1)
+        # Saving the existing record again is still allowed
+        first.save()
+
+
+class RollupTests(TestCase):
+    def rollups(self):
+        return (
+            sorted(DailyOrderRollup.objects.filter(order_count__gt=0).values_list('day', 'status', 'order_count', 'quantity', 'amount')),
+            sorted(CustomerOrderRollup.objects.filter(order_count__gt=0).values_list('order_received_from', 'status', 'order_count', 'quantity', 'amount')),
+        )
 
-# Create your tests here.
+    def test_queryset_and_cascade_deletes_keep_rollups(self):
+        user = User.objects.create_user('leaver')
+        seed_orders(9, user)
+        seed_orders(9)
+        Order.objects.filter(status='Stitching').delete()
+        user.delete()
+        kept = self.rollups()
+        rebuild_order_rollups()
+        self.assertEqual(kept, self.rollups())
+        self.assertEqual(sum(row[2] for row in kept[0]), Order.objects.count())
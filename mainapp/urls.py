@@ -17,6 +17,7 @@ urlpatterns = [
     path('addextrawork/<int:id>', views.add_extrawork, name='addextrawork'),
     path('addfinishingandpacking/<int:id>', views.add_finishingandpacking, name='addfinishingandpacking'),
     path('adddispatch/<int:id>', views.add_dispatch, name='adddispatch'),
+    path('import', views.import_orders, name='import_orders'),
 
     path('filter/<str:status>', views.filter_by_status, name='filter_by_status'),
     path('search', views.search_orders, name='search_orders'),
@@ -24,4 +25,6 @@ urlpatterns = [
     path('trackdyers', views.track_dyers, name='track_dyers'),
     path('trackfabrics', views.track_fabrics, name='track_fabrics'),
     path('export/<str:timespan>', views.export_orders_csv, name='export_orders_csv'),
+    path('autocomplete/<str:field>', views.autocomplete, name='autocomplete'),
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -3,18 +3,31 @@ from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate, logout
 from django.contrib import messages
+from django.core.exceptions import ValidationError
 from django.db.models import Sum, Count, Q
 from django.db.models.functions import TruncDay, TruncMonth
 from datetime import datetime, date
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 
 import calendar
 import random
-import csv
-# from django.utils import timezone
-
-from .models import Order, FabricPurchased, PrintingAndDyeingSent, PrintingAndDyeingReceived, ClothCutting, Stitching, ExtraWork, FinishingAndPacking, Dispatch
-from .forms import OrderForm, FabricPurchasedForm, PrintingAndDyeingSentForm, PrintingAndDyeingReceivedForm, ClothCuttingForm, StitchingForm, ExtraWorkForm, FinishingAndPackingForm, DispatchForm
+from django.conf import settings
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.safestring import mark_safe
+
+from .models import Order, FabricPurchased, PrintingAndDyeingSent, PrintingAndDyeingReceived, ClothCutting, Stitching, ExtraWork, FinishingAndPacking, Dispatch, DailyOrderRollup, CustomerOrderRollup
+from .order_stages import STATUS_POSITIONS, render_stage_sections
+from .writer import run_write
+from .routers import read_only
+from .dashboard import get_dashboard_snapshot, get_status_groups
+from .pagination import keyset_paginate, ranked_paginate
+from .autocomplete import AUTOCOMPLETE_SOURCES, suggest
+from .search import fallback_filter, is_supported as search_is_supported, search_order_ids
+from .exports import get_watermark, set_watermark, stream_orders_csv, touched_since
+from .imports import import_file
+from .metrics import CONTENT_TYPE_LATEST, render_metrics
+from .forms import OrderForm, FabricPurchasedForm, PrintingAndDyeingSentForm, PrintingAndDyeingReceivedForm, ClothCuttingForm, StitchingForm, ExtraWorkForm, FinishingAndPackingForm, DispatchForm, ImportForm
 
 # Create your views here.
 
@@ -77,85 +90,36 @@ def index(request):
     # Query all the orders for this month
     orders = Order.objects.filter(order_date__gte=first_day_of_month).order_by('-order_date')
 
-    total_orders = Order.objects.count()
-    in_pending = Order.objects.filter(status='Pending').count()
-    # total_revenue = Order.objects.aggregate(total_revenue=Sum('amount'))['total_revenue'] or 0
-    in_production = Order.objects.exclude(status='Dispatched').count() - in_pending
-    dispatched_orders = Order.objects.filter(status='Dispatched').count()
-
-    # Get all orders placed in the current month
-    start_of_month = today.replace(day=1)
-    orders_this_month = Order.objects.filter(order_date__gte=start_of_month)
-
-    # Get all orders placed in the current month
-    orders_this_month = Order.objects.filter(order_date__gte=start_of_month)
-
-    # Count the number of orders in each status
-    # Annotate the orders with their status and count them
-    status_data = (
-        orders_this_month
-        .values('status')
-        .annotate(order_count=Count('id'))
-        .order_by('status')
-    )
-    
-    # Prepare data for the chart
-    statuses = ["Pending", "Fabric Purchased", "Printing and Dyeing Sent", "Printing and Dyeing Received", "Cloth Cutting", "Stitching", "Extra Work", "Finishing and Packing", "Dispatched"]
-    order_counts = [0] * len(statuses)
-    for data in status_data:
-        status_index = statuses.index(data['status'])
-        order_counts[status_index] = data['order_count']
-    
-    # ==================== Pending Duration Chart ====================
-
-    # Get all orders that are not dispatched, and order them by order_date (descending)
-    incomplete_orders = Order.objects.exclude(status='Dispatched').order_by('-order_date')[:10]
-
-    # Prepare data for the chart
-    order_labels = []
-    waiting_times = []
-
-    for order in incomplete_orders:
-        # Calculate the waiting time in days
-        waiting_days = (today.date() - order.order_date).days
-        order_labels.append(f"Order #{order.style_id}")
-        waiting_times.append(waiting_days)
-
-    context = {
-        'total_orders': total_orders,
-        # 'total_revenue': total_revenue,
-        'in_pending': in_pending,
-        'in_production': in_production,
-        'dispatched_orders': dispatched_orders,
-        'orders': orders, # Display all orders
-        'statuses': statuses,
-        'order_counts': order_counts,
-        'order_labels': order_labels,
-        'waiting_time_in_days': waiting_times,
-    }
+    # Counters and chart data are served from a short lived cached snapshot
+    context = dict(get_dashboard_snapshot())
+    context['orders'] = orders # Display all orders
     return render(request, 'index.html', context)
 
+@read_only
 def index2(request):
 
     # This is index function with additional data fetching and processing
-    orders = Order.objects.all().order_by('-order_date')
+    orders = keyset_paginate(request, Order.objects.all())
     
-    # Get monthly revenue data
-    monthly_revenue = Order.objects.annotate(
-        month=TruncMonth('order_date')
+    # Get monthly revenue data from the daily rollup table
+    monthly_revenue = DailyOrderRollup.objects.annotate(
+        month=TruncMonth('day')
     ).values('month').annotate(
         total=Sum('amount')
     ).order_by('month')
     
-    # Get top customers by order volume
-    top_customers = Order.objects.values('order_received_from').annotate(
+    # Get top customers by order volume from the customer rollup table
+    top_customers = CustomerOrderRollup.objects.values('order_received_from').annotate(
         total_quantity=Sum('quantity'),
-        order_count=Count('id')
-    ).order_by('-total_quantity')[:5]
+        order_count=Sum('order_count'),
+        total_amount=Sum('amount'),
+    ).filter(order_count__gt=0).order_by('-total_quantity')[:5]
     
     context = {
         'orders': orders,
+        'page': orders,
         'STATUS': Order.STATUS,
+        'status_groups': get_status_groups(),
         'monthly_revenue': monthly_revenue,
         'top_customers': top_customers,
     }
@@ -195,26 +159,38 @@ def add_order(request):
         form = OrderForm(request.POST)
         if form.is_valid():
             form.instance.user = request.user
-            form.save()
+            run_write(form.save)
             messages.success(request, 'Order added successfully.')
             return redirect('index')
     else:
         form = OrderForm()
     return render(request, 'add_order.html', {'form': form})
 
+@login_required
+def import_orders(request):
+    if not request.user.is_staff:
+        messages.error(request, 'Only staff can import records.')
+        return redirect('index')
+
+    report = None
+    if request.method == 'POST':
+        form = ImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            file_format = 'jsonl' if upload.name.lower().endswith('.jsonl') else 'csv'
+            report = run_write(import_file, upload.file, file_format, request.user, form.cleaned_data['model'])
+            if report.total_created:
+                messages.success(request, f'Imported {report.total_created} records.')
+            if report.errors:
+                messages.error(request, f'{report.rejected_rows} rows were rejected, see the errors below.')
+    else:
+        form = ImportForm()
+    return render(request, 'import_orders.html', {'form': form, 'report': report})
+
 @login_required
 def order_detail(request, id):
-    order = get_object_or_404(Order, id=id)
-    
-    # Get all related process objects (if they exist)
-    fabric_purchased = FabricPurchased.objects.filter(order=order).first()
-    printing_dyeing_sent = PrintingAndDyeingSent.objects.filter(order=order).first()
-    printing_dyeing_received = PrintingAndDyeingReceived.objects.filter(order=order).first()
-    cloth_cutting = ClothCutting.objects.filter(order=order).first()
-    stitching = Stitching.objects.filter(order=order).first()
-    extra_works = ExtraWork.objects.filter(order=order)
-    finishing_packing = FinishingAndPacking.objects.filter(order=order).first()
-    dispatch = Dispatch.objects.filter(order=order).first()
+    order = get_object_or_404(Order.objects.select_related('user'), id=id)
+    status_position = STATUS_POSITIONS.get(order.status, 0)
 
     order_size_quantities = [
         ["S", order.quantity_xs],
@@ -232,20 +208,12 @@ def order_detail(request, id):
         ["10XL", order.quantity_10xl]
     ]
 
-    if dispatch:
-        dispatch.box_details = [item for item in dispatch.box_details.replace("\r", "\n").split("\n") if item.strip() != ""]
-
     context = {
         'order': order,
-        'fabric_purchased': fabric_purchased,
-        'printing_dyeing_sent': printing_dyeing_sent,
-        'printing_dyeing_received': printing_dyeing_received,
-        'cloth_cutting': cloth_cutting, 
-        'stitching': stitching,
-        'extra_works': extra_works,
-        'finishing_packing': finishing_packing,
-        'dispatch': dispatch,
-        'order_size_quantities': order_size_quantities
+        'status_position': status_position,
+        'order_size_quantities': order_size_quantities,
+        # Stage records are only loaded when their sections are not cached
+        'stage_sections': mark_safe(render_stage_sections(order, status_position)),
     }
     return render(request, 'order_detail.html', context)
 
@@ -263,7 +231,12 @@ def add_fabricpurchased(request, id):
             fabric_purchased = form.save(commit=False)
             fabric_purchased.order = order
             fabric_purchased.user = request.user
-            fabric_purchased.save()
+            try:
+                run_write(fabric_purchased.save)
+            except ValidationError as error:
+                # The order moved on since it was checked above
+                messages.error(request, error.message)
+                return redirect('orderdetail', id=id)
             messages.success(request, 'Fabric purchased details added successfully.')
             return redirect('orderdetail', id=id)
     else:
@@ -283,7 +256,12 @@ def add_printinganddyeingsent(request, id):
             printing_dyeing_sent = form.save(commit=False)
             printing_dyeing_sent.order = order
             printing_dyeing_sent.user = request.user
-            printing_dyeing_sent.save()
+            try:
+                run_write(printing_dyeing_sent.save)
+            except ValidationError as error:
+                # The order moved on since it was checked above
+                messages.error(request, error.message)
+                return redirect('orderdetail', id=id)
             messages.success(request, 'Printing and dyeing sent details added successfully.')
             return redirect('orderdetail', id=id)
     else:
@@ -315,7 +293,12 @@ def add_printinganddyeingreceived(request, id):
             printing_dyeing_received.order = order
             printing_dyeing_received.printing_and_dyeing_sent = printing_dyeing_sent
             printing_dyeing_received.user = request.user
-            printing_dyeing_received.save()
+            try:
+                run_write(printing_dyeing_received.save)
+            except ValidationError as error:
+                # The order moved on since it was checked above
+                messages.error(request, error.message)
+                return redirect('orderdetail', id=id)
             # Saving the received status in the sent record in this model's save()
             messages.success(request, 'Printing and dyeing received details added successfully.')
             return redirect('orderdetail', id=id)
@@ -343,7 +326,12 @@ def add_clothcutting(request, id):
             cloth_cutting = form.save(commit=False)
             cloth_cutting.order = order
             cloth_cutting.user = request.user
-            cloth_cutting.save()
+            try:
+                run_write(cloth_cutting.save)
+            except ValidationError as error:
+                # The order moved on since it was checked above
+                messages.error(request, error.message)
+                return redirect('orderdetail', id=id)
             messages.success(request, 'Cloth cutting details added successfully.')
             return redirect('orderdetail', id=id)
     else:
@@ -364,7 +352,12 @@ def add_stitching(request, id):
             stitching = form.save(commit=False)
             stitching.order = order
             stitching.user = request.user
-            stitching.save()
+            try:
+                run_write(stitching.save)
+            except ValidationError as error:
+                # The order moved on since it was checked above
+                messages.error(request, error.message)
+                return redirect('orderdetail', id=id)
             messages.success(request, 'Stitching details added successfully.')
             return redirect('orderdetail', id=id)
     else:
@@ -385,7 +378,7 @@ def add_extrawork(request, id):
             extra_work = form.save(commit=False)
             extra_work.order = order
             extra_work.user = request.user
-            extra_work.save()
+            run_write(extra_work.save)
             messages.success(request, 'Extra work details added successfully.')
             return redirect('orderdetail', id=id)
     else:
@@ -406,7 +399,12 @@ def add_finishingandpacking(request, id):
             finishing_packing = form.save(commit=False)
             finishing_packing.order = order
             finishing_packing.user = request.user
-            finishing_packing.save()
+            try:
+                run_write(finishing_packing.save)
+            except ValidationError as error:
+                # The order moved on since it was checked above
+                messages.error(request, error.message)
+                return redirect('orderdetail', id=id)
             messages.success(request, 'Finishing and packing details added successfully.')
             return redirect('orderdetail', id=id)
     else:
@@ -427,7 +425,12 @@ def add_dispatch(request, id):
             dispatch = form.save(commit=False)
             dispatch.order = order
             dispatch.user = request.user
-            dispatch.save()
+            try:
+                run_write(dispatch.save)
+            except ValidationError as error:
+                # The order moved on since it was checked above
+                messages.error(request, error.message)
+                return redirect('orderdetail', id=id)
             messages.success(request, 'Dispatch details added successfully.')
             return redirect('orderdetail', id=id)
     else:
@@ -453,12 +456,22 @@ def filter_by_status(request, status):
     else:
         orders = Order.objects.filter(status=status)
     
+    page = keyset_paginate(request, orders)
     context = {
-        'orders': orders,
+        'orders': page,
+        'page': page,
         'status': status,
     }
     return render(request, 'filter.html', context)
 
+def search_page(request, search_string, params):
+    # Ranked full-text search where the database supports it, a plain filter otherwise
+    if search_is_supported():
+        return ranked_paginate(
+            request, lambda limit, offset: search_order_ids(search_string, limit, offset), params=params
+        )
+    return keyset_paginate(request, Order.objects.filter(fallback_filter(search_string)), params=params)
+
 @login_required
 def search_orders(request):
     if request.user.is_authenticated:
@@ -467,10 +480,11 @@ def search_orders(request):
             if not search_string or search_string.isspace() or search_string == '':
                 messages.error(request, 'Search query cannot be empty.')
                 return redirect('index')
-            orders = Order.objects.filter(Q(style_id=search_string) |
-                                        Q(order_received_from__icontains=search_string)).order_by('-order_date')
+            # Further pages are fetched with GET requests carrying the search string
+            page = search_page(request, search_string, params={'search': search_string})
             context = {
-                'orders': orders,
+                'orders': page,
+                'page': page,
                 'search_string': search_string,
             }
             return render(request, 'search.html', context)
@@ -484,7 +498,7 @@ def search_orders(request):
                 orders = Order.objects.filter(
                     status='Printing and Dyeing Sent',
                     printinganddyeingsent__dyer_printer_name__iexact=search_string
-                ).order_by('-order_date')
+                )
             elif search_on == 'fabric_detail':
                 orders = Order.objects.filter(
                     status__in=['Fabric Purchased', 'Printing and Dyeing Sent',
@@ -495,9 +509,17 @@ def search_orders(request):
                                 'Finishing and Packing'
                                 ],
                     printinganddyeingsent__fabric_detail__iexact=search_string
-                ).order_by('-order_date')
+                )
+            else:
+                orders = None
+            params = {'search_on': search_on, 'search': search_string}
+            if orders is None:
+                page = search_page(request, search_string, params=params)
+            else:
+                page = keyset_paginate(request, orders, params=params)
             context = {
-                'orders': orders,
+                'orders': page,
+                'page': page,
                 'search_string': search_string,
             }
             return render(request, 'search.html', context)
@@ -508,6 +530,7 @@ def search_orders(request):
         messages.error(request, 'Log into your account to access this page.')
         return redirect('index')
 
+@read_only
 def track_dyers(request):
     unreceived = (
         PrintingAndDyeingSent.objects
@@ -521,6 +544,7 @@ def track_dyers(request):
     )
     return render(request, 'track_dyers.html', {'unreceived': unreceived})
 
+@read_only
 def track_fabrics(request):
     fabrics = (
     PrintingAndDyeingSent.objects
@@ -548,7 +572,11 @@ def export_orders_csv(request, timespan):
     Export orders as CSV based on timespan parameter:
     - 'y': current financial year (April 1 to March 31)
     - 'm': current month
+    - 'd': orders changed since this consumer's previous 'd' export, repeating
+      those changed within EXPORT_WATERMARK_OVERLAP seconds before it; deleted
+      orders are not included
     
+    The consumer for 'd' is the POSTed ``consumer`` value, or the logged in user.
     Multiple ExtraWork entries are added at the end of each row.
     """
 
@@ -557,9 +585,17 @@ def export_orders_csv(request, timespan):
         return redirect('index')
 
     # Validate timespan parameter
-    if timespan not in ['y', 'm']:
-        return HttpResponse("Invalid timespan parameter. Use 'y' for yearly or 'm' for monthly.", status=400)
+    if timespan not in ['y', 'm', 'd']:
+        return HttpResponse("Invalid timespan parameter. Use 'y' for yearly, 'm' for monthly or 'd' for changes since the last download.", status=400)
     
+    if timespan == 'd':
+        return export_changed_orders_csv(request)
+    return export_date_range_csv(request, timespan)
+
+# Read from the replica; the 'd' export stays on the primary, as reading a
+# lagging copy there would move the watermark past changes it never saw
+@read_only
+def export_date_range_csv(request, timespan):
     # Calculate date range based on timespan
     today = date.today()
     
@@ -581,228 +617,48 @@ def export_orders_csv(request, timespan):
     orders = Order.objects.filter(
         order_date__gte=start_date,
         order_date__lte=end_date
-    ).order_by('order_date')
+    ).order_by('order_date', 'id')
     
-    # Find the maximum number of ExtraWork entries for any order
-    max_extra_works = 0
-    for order in orders:
-        extra_works_count = ExtraWork.objects.filter(order=order).count()
-        if extra_works_count > max_extra_works:
-            max_extra_works = extra_works_count
-    
-    # Create HTTP response with CSV file
-    response = HttpResponse(content_type='text/csv')
+    # Stream the CSV so the whole file is never held in memory
+    response = StreamingHttpResponse(stream_orders_csv(orders), content_type='text/csv')
     filename = f"orders_{timespan}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
     
-    # Create CSV writer
-    writer = csv.writer(response)
-    
-    # Base header (without ExtraWork)
-    base_header = [
-        'Order ID', 'Style ID', 'PO Number', 'Order Date', 'Order From', 
-        # Size quantities
-        'Qty XS', 'Qty S', 'Qty M', 'Qty L', 'Qty XL', 'Qty 2XL', 'Qty 3XL', 
-        'Qty 4XL', 'Qty 5XL', 'Qty 6XL', 'Qty 7XL', 'Qty 8XL', 'Qty 9XL', 'Qty 10XL',
-        'Total Quantity', 'Rate', 'Status', 'Amount',
-        
-        # Fabric Purchased fields
-        'Fabric Purchase Date', 'Purchased From', 'Fabric Quantity', 'Fabric Rate', 'Fabric Amount',
-        'Invoice Number', 'Fabric Detail', 'Fabric Length', 'Fabric Dyer',
-        
-        # Printing & Dyeing Sent fields
-        'P&D Sent Date', 'Dyer/Printer Name', 'P&D Fabric Detail', 'P&D Fabric Length',
-        'P&D Issued Quantity', 'P&D Received Status',
-        
-        # Printing & Dyeing Received fields
-        'P&D Received Date', 'Shrinkage (%)', 'P&D Received Quantity', 
-        'P&D Balance Quantity', 'P&D Received Challan', 'P&D Rate', 'P&D Amount',
-        
-        # Cloth Cutting fields
-        'Cutting Issued Date', 'Cutting Challan', 'Cutting Worker Name', 'Cutting Fabric Detail',
-        'Cutting Fabric Length', 'Cutting Issued Quantity', 'Cutting Received Quantity',
-        'Cutting Balance', 'Cutting Received Date', 'Cutting Received Challan', 'Cutting Rate', 'Cutting Amount',
-        
-        # Stitching fields
-        'Stitching Issued Date', 'Stitching Challan', 'Stitching Worker Name', 'Stitching Issued Quantity',
-        'Stitching Received Quantity', 'Stitching Balance', 'Stitching Received Date', 
-        'Stitching Rate', 'Stitching Amount',
-        
-        # Finishing & Packing fields
-        'F&P Issued Date', 'F&P Challan', 'F&P Worker Name', 'F&P Issued Quantity',
-        'F&P Packed Quantity', 'F&P Rejected', 'F&P Rate', 'F&P Amount',
-        
-        # Dispatch fields
-        'Dispatch Date', 'Dispatched To', 'Dispatch Quantity', 'Delivery Note',
-        'Dispatch Invoice Number', 'Box Details',
-    ]
-    
-    # Add ExtraWork headers at the end
-    extra_work_headers = []
-    for i in range(1, max_extra_works + 1):
-        extra_work_headers.extend([
-            f'Extra Work {i} Issued Date', 
-            f'Extra Work {i} Challan', 
-            f'Extra Work {i} Worker Name', 
-            f'Extra Work {i} Type',
-            f'Extra Work {i} Issued Qty', 
-            f'Extra Work {i} Received Qty', 
-            f'Extra Work {i} Balance',
-            f'Extra Work {i} Rate', 
-            f'Extra Work {i} Amount', 
-            f'Extra Work {i} Received Date'
-        ])
-    
-    # Complete header
-    header = base_header + extra_work_headers
-    writer.writerow(header)
-    
-    # Write data rows
-    for order in orders:
-        # Get related objects
-        try:
-            fabric = FabricPurchased.objects.filter(order=order).first()
-        except FabricPurchased.DoesNotExist:
-            fabric = None
-            
-        try:
-            pd_sent = PrintingAndDyeingSent.objects.filter(order=order).first()
-        except PrintingAndDyeingSent.DoesNotExist:
-            pd_sent = None
-            
-        try:
-            pd_received = PrintingAndDyeingReceived.objects.filter(order=order).first() 
-        except PrintingAndDyeingReceived.DoesNotExist:
-            pd_received = None
-            
-        try:
-            cutting = ClothCutting.objects.filter(order=order).first()
-        except ClothCutting.DoesNotExist:
-            cutting = None
-            
-        try:
-            stitching = Stitching.objects.filter(order=order).first()
-        except Stitching.DoesNotExist:
-            stitching = None
-            
-        try:
-            finishing = FinishingAndPacking.objects.filter(order=order).first()
-        except FinishingAndPacking.DoesNotExist:
-            finishing = None
-            
-        try:
-            dispatch = Dispatch.objects.filter(order=order).first()
-        except Dispatch.DoesNotExist:
-            dispatch = None
-        
-        # Base row (without ExtraWork)
-        base_row = [
-            order.id, order.style_id, order.po_number, order.order_date, order.order_received_from,
-            # Size quantities
-            order.quantity_xs, order.quantity_s, order.quantity_m, order.quantity_l, 
-            order.quantity_xl, order.quantity_2xl, order.quantity_3xl, order.quantity_4xl,
-            order.quantity_5xl, order.quantity_6xl, order.quantity_7xl, order.quantity_8xl,
-            order.quantity_9xl, order.quantity_10xl,
-            order.quantity, order.rate, order.status, order.amount,
-            
-            # Fabric Purchased fields
-            fabric.fabric_purchase_date if fabric else '',
-            fabric.purchased_from if fabric else '',
-            fabric.quantity if fabric else '',
-            fabric.rate if fabric else '',
-            fabric.amount if fabric else '',
-            fabric.invoice_number if fabric else '',
-            fabric.fabric_detail if fabric else '',
-            fabric.fabric_length if fabric else '',
-            fabric.fabric_dyer if fabric else '',
-            
-            # Printing & Dyeing Sent fields
-            pd_sent.issued_challan_date if pd_sent else '',
-            pd_sent.dyer_printer_name if pd_sent else '',
-            pd_sent.fabric_detail if pd_sent else '',
-            pd_sent.fabric_length if pd_sent else '',
-            pd_sent.issued_challan_quantity if pd_sent else '',
-            pd_sent.received if pd_sent else '',
-            
-            # Printing & Dyeing Received fields
-            pd_received.received_date if pd_received else '',
-            pd_received.shrinkage_in_percentage if pd_received else '',
-            pd_received.received_quantity if pd_received else '',
-            pd_received.balance_quantity if pd_received else '',
-            pd_received.received_challan_number if pd_received else '',
-            pd_received.rate if pd_received else '',
-            pd_received.amount if pd_received else '',
-            
-            # Cloth Cutting fields
-            cutting.issued_challan_date if cutting else '',
-            cutting.issued_challan_number if cutting else '',
-            cutting.job_worker_name if cutting else '',
-            cutting.fabric_detail if cutting else '',
-            cutting.fabric_length if cutting else '',
-            cutting.issued_challan_quantity if cutting else '',
-            cutting.received_quantity if cutting else '',
-            cutting.balance_quantity if cutting else '',
-            cutting.received_date if cutting else '',
-            cutting.received_challan_number if cutting else '',
-            cutting.rate if cutting else '',
-            cutting.amount if cutting else '',
-            
-            # Stitching fields
-            stitching.issued_challan_date if stitching else '',
-            stitching.issued_challan_number if stitching else '',
-            stitching.job_worker_name if stitching else '',
-            stitching.issued_challan_quantity if stitching else '',
-            stitching.received_quantity if stitching else '',
-            stitching.balance_quantity if stitching else '',
-            stitching.received_date if stitching else '',
-            stitching.rate if stitching else '',
-            stitching.amount if stitching else '',
-            
-            # Finishing & Packing fields
-            finishing.issued_challan_date if finishing else '',
-            finishing.issued_challan_number if finishing else '',
-            finishing.job_worker_name if finishing else '',
-            finishing.issued_challan_quantity if finishing else '',
-            finishing.packed_quantity if finishing else '',
-            finishing.rejected if finishing else '',
-            finishing.rate if finishing else '',
-            finishing.amount if finishing else '',
-            
-            # Dispatch fields
-            dispatch.dispatch_date if dispatch else '',
-            dispatch.dispatched_to if dispatch else '',
-            dispatch.quantity if dispatch else '',
-            dispatch.delivery_note if dispatch else '',
-            dispatch.invoice_number if dispatch else '',
-            dispatch.box_details if dispatch else '',
-        ]
-        
-        # Get all ExtraWork items for this order
-        extra_works = ExtraWork.objects.filter(order=order).order_by('id')
-        
-        # Add ExtraWork data
-        extra_work_data = []
-        for i in range(max_extra_works):
-            if i < len(extra_works):
-                work = extra_works[i]
-                extra_work_data.extend([
-                    work.issued_challan_date,
-                    work.issued_challan_number,
-                    work.job_worker_name,
-                    work.extra_work_name,
-                    work.issued_challan_quantity,
-                    work.received_quantity,
-                    work.balance_quantity,
-                    work.rate,
-                    work.amount,
-                    work.received_date
-                ])
-            else:
-                # Add empty fields for orders with fewer ExtraWork entries
-                extra_work_data.extend([''] * 10)  # 10 fields per ExtraWork
-        
-        # Complete row
-        row = base_row + extra_work_data
-        writer.writerow(row)
-    
-    return response
\ No newline at end of file
+    return response
+
+def export_changed_orders_csv(request):
+    consumer = request.POST.get('consumer') or f'user:{request.user.username}'
+    # Taken before reading so changes made during the export are picked up next time
+    started_at = timezone.now()
+    since = get_watermark(consumer)
+
+    orders = Order.objects.order_by('order_date', 'id')
+    if since is not None:
+        orders = touched_since(orders, since)
+
+    def rows():
+        yield from stream_orders_csv(orders)
+        # Only move the watermark once the whole file has been sent
+        set_watermark(consumer, started_at)
+
+    response = StreamingHttpResponse(rows(), content_type='text/csv')
+    filename = f"orders_d_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def autocomplete(request, field):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Log into your account to access this page.'}, status=403)
+    if field not in AUTOCOMPLETE_SOURCES:
+        return JsonResponse({'error': f'Unknown field {field}.'}, status=404)
+    return JsonResponse({'results': suggest(field, request.GET.get('q', ''))})
+
+def metrics(request):
+    """Prometheus metrics, for the addresses in METRICS_ALLOWED_IPS or holders of METRICS_TOKEN."""
+    authorization = request.headers.get('Authorization', '')
+    allowed = request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS or (
+        settings.METRICS_TOKEN and constant_time_compare(authorization, f'Bearer {settings.METRICS_TOKEN}')
+    )
+    if not allowed:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
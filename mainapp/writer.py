@@ -0,0 +1,122 @@
+# Optional single writer for SQLite. SQLite only lets one connection write at a
+# time, so instead of every request thread taking its own write transaction and
+# waiting on the lock, writes are handed to one thread per process, which runs
+# the writes that arrive close together in one transaction and commits them once.
+import contextvars
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+# Most writes committed together in one transaction
+WRITE_GROUP_MAX = 50
+
+# Attempts at taking the write lock for a group, and the backoff between them
+WRITE_RETRY_ATTEMPTS = 5
+WRITE_RETRY_DELAY = 0.05
+WRITE_RETRY_MAX_DELAY = 1.0
+
+
+def is_enabled():
+    return settings.SERIALIZE_WRITES and connection.vendor == 'sqlite'
+
+
+class WriteQueue:
+    def __init__(self):
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Run ``func(*args, **kwargs)`` on the writer thread, in a savepoint of the
+        group's transaction, and return its result or raise its exception once
+        the group is committed.
+        """
+        self._ensure_started()
+        future = Future()
+        # Jobs run in the caller's context, so per request state set there
+        # (like the replica router's write tracking) still applies
+        context = contextvars.copy_context()
+        self._jobs.put((context.run, (func, *args), kwargs, future))
+        return future.result()
+
+    def _ensure_started(self):
+        # A forked worker doesn't inherit the parent's writer thread
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._jobs = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='kms-writer', daemon=True)
+                self._thread.start()
+
+    def _next_group(self):
+        group = [self._jobs.get()]
+        deadline = time.monotonic() + settings.WRITE_GROUP_WINDOW_MS / 1000
+        while len(group) < WRITE_GROUP_MAX:
+            remaining = deadline - time.monotonic()
+            try:
+                group.append(self._jobs.get(timeout=remaining) if remaining > 0 else self._jobs.get_nowait())
+            except queue.Empty:
+                break
+        return group
+
+    def _run(self):
+        while True:
+            self._commit(self._next_group())
+
+    def _commit(self, group):
+        results = []
+        delay = WRITE_RETRY_DELAY
+        for attempt in range(WRITE_RETRY_ATTEMPTS):
+            results = []
+            try:
+                # Take the write lock as the group's transaction starts, so the
+                # only lock failure is one before any job ran, which is safe to
+                # retry. Connecting resets the mode, hence setting it every time.
+                connection.ensure_connection()
+                connection.transaction_mode = 'IMMEDIATE'
+                with transaction.atomic():
+                    for func, args, kwargs, _ in group:
+                        try:
+                            with transaction.atomic():
+                                results.append((func(*args, **kwargs), None))
+                        except Exception as error:
+                            results.append((None, error))
+                break
+            except OperationalError as error:
+                if results or attempt == WRITE_RETRY_ATTEMPTS - 1:
+                    # Jobs ran but the commit failed, or the lock never freed up
+                    results = [(None, error)] * len(group)
+                    break
+                time.sleep(delay)
+                delay = min(delay * 2, WRITE_RETRY_MAX_DELAY)
+            except Exception as error:
+                results = [(None, error)] * len(group)
+                break
+
+        for (_, _, _, future), (result, error) in zip(group, results):
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+writer = WriteQueue()
+
+
+def run_write(func, *args, **kwargs):
+    """
+    Run a model write such as ``instance.save`` through the process's writer when
+    SERIALIZE_WRITES is on, or right away otherwise.
+    """
+    if is_enabled():
+        return writer.submit(func, *args, **kwargs)
+    return func(*args, **kwargs)